@@ -1,7 +1,7 @@
 import pandas as pd
 import streamlit as st
 import base64
-import os, json, hashlib, secrets, html, re, shutil, importlib
+import os, json, hashlib, secrets, html, re, tempfile
 
 # ========== PAGE CONFIG ==========
 st.set_page_config(
@@ -13,6 +13,31 @@ st.set_page_config(
 
 # Import after page config
 import src.chat as chat
+import src.ingest as ingest
+
+# ========== FILES ==========
+def write_if_changed(path, data):
+    """
+    Replace `path` with `data` only if its content differs, atomically (temp
+    file in the same directory, then os.replace), so a background index
+    build reading the old file never sees a half-written one.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
 
 # ========== PDF VIEWER ==========
 def create_pdf_viewer(pdf_path, page_number):
@@ -450,17 +475,31 @@ with st.sidebar:
     if uploaded is not None:
         os.makedirs("./data", exist_ok=True)
         temp_path = "./data/_uploaded_agreement.pdf"
-        with open(temp_path, "wb") as f:
-            f.write(uploaded.read())
+        # Streamlit reruns the script on every interaction: rewrite only for new content
+        write_if_changed(temp_path, uploaded.getvalue())
         st.success(f"✓ {uploaded.name}")
 
+        # Index in the background as soon as the file arrives; until the
+        # search index is ready, questions are answered by keyword match.
+        index_job = ingest.start_index_build(temp_path)
+        if index_job.stage == "failed":
+            st.warning(f"Indexing failed: {index_job.error}")
+            if st.button("Retry indexing", use_container_width=True, key="retry_index_build"):
+                ingest.start_index_build(temp_path, retry=True)
+                st.rerun()
+        elif not index_job.done:
+            st.progress(index_job.progress, text=f"⏳ {index_job.label}… (quick answers available meanwhile)")
+            if st.button("Refresh status", use_container_width=True, key="refresh_index_status"):
+                st.rerun()
+
         if st.button("Use for Q&A", use_container_width=True, key="use_uploaded_qna"):
             st.session_state.active_pdf_path = temp_path
             try:
-                shutil.copyfile(temp_path, DEFAULT_PDF_PATH)
+                write_if_changed(DEFAULT_PDF_PATH, uploaded.getvalue())
             except Exception as e:
                 st.warning(f"Error: {e}")
-            importlib.reload(chat)
+            # point chat at the new content; the module (and its OpenAI connections) stays loaded
+            chat.set_active_pdf(DEFAULT_PDF_PATH)
             st.cache_data.clear()
             st.rerun()
 
@@ -471,7 +510,7 @@ with st.sidebar:
 
     if st.button("Reset", use_container_width=True, key="reset_pdf"):
         st.session_state.active_pdf_path = DEFAULT_PDF_PATH
-        importlib.reload(chat)
+        chat.set_active_pdf(DEFAULT_PDF_PATH)
         st.cache_data.clear()
         st.rerun()
 
@@ -486,6 +525,9 @@ with st.sidebar:
     st.caption("Click to ask instantly")
 
     if FAQ_ITEMS:
+        # Index the sample contract in the background too, so its FAQ answers are precomputed
+        if os.path.exists(DEFAULT_PDF_PATH):
+            ingest.start_index_build(DEFAULT_PDF_PATH)
         for category, questions in FAQ_ITEMS.items():
             with st.expander(f"**{category}**", expanded=False):
                 for q in questions:
@@ -510,14 +552,39 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ========== CHAT DISPLAY ==========
+def user_bubble(text):
+    return (
+        f'<div style="display:flex;justify-content:flex-end;margin:0.75rem 0;">'
+        f'<div class="user-msg">{text}</div>'
+        f'</div>'
+    )
+
+def assistant_bubble(answer, can_answer, score, is_comprehensive):
+    match_percentage = int(round((1 - score) * 100)) if score is not None else 0
+
+    if can_answer:
+        status_badge = f'<span class="conf-badge conf-high">✅ Answer</span>'
+        if is_comprehensive:
+            status_badge += f'<span class="conf-badge" style="background:linear-gradient(135deg, #8b5cf6 0%, #7c3aed 100%);color:white;">🔍 Detailed</span>'
+        status_badge += f'<span class="conf-badge conf-accuracy">Match: {match_percentage}%</span>'
+    else:
+        status_badge = f'<span class="conf-badge conf-low">⚠️ Not Found</span>'
+        status_badge += f'<span class="conf-badge conf-accuracy">Score: {match_percentage}%</span>'
+
+    return f"""
+            <div style="display:flex;justify-content:flex-start;margin:0.75rem 0;">
+                <div class="assistant-msg">
+                    <div style="display:flex;gap:6px;flex-wrap:wrap;margin-bottom:0.85rem;">
+                        {status_badge}
+                    </div>
+                    {answer}
+                </div>
+            </div>
+            """
+
 for i, msg in enumerate(st.session_state.messages):
     if msg["role"] == "user":
-        st.markdown(
-            f'<div style="display:flex;justify-content:flex-end;margin:0.75rem 0;">'
-            f'<div class="user-msg">{msg["content"]}</div>'
-            f'</div>',
-            unsafe_allow_html=True
-        )
+        st.markdown(user_bubble(msg["content"]), unsafe_allow_html=True)
     else:
         content = msg["content"]
         if isinstance(content, dict):
@@ -533,30 +600,7 @@ for i, msg in enumerate(st.session_state.messages):
             score = 1.0
             is_comprehensive = False
 
-        match_percentage = int(round((1 - score) * 100)) if score is not None else 0
-        
-        if can_answer:
-            status_badge = f'<span class="conf-badge conf-high">✅ Answer</span>'
-            if is_comprehensive:
-                status_badge += f'<span class="conf-badge" style="background:linear-gradient(135deg, #8b5cf6 0%, #7c3aed 100%);color:white;">🔍 Detailed</span>'
-            status_badge += f'<span class="conf-badge conf-accuracy">Match: {match_percentage}%</span>'
-        else:
-            status_badge = f'<span class="conf-badge conf-low">⚠️ Not Found</span>'
-            status_badge += f'<span class="conf-badge conf-accuracy">Score: {match_percentage}%</span>'
-
-        st.markdown(
-            f"""
-            <div style="display:flex;justify-content:flex-start;margin:0.75rem 0;">
-                <div class="assistant-msg">
-                    <div style="display:flex;gap:6px;flex-wrap:wrap;margin-bottom:0.85rem;">
-                        {status_badge}
-                    </div>
-                    {answer}
-                </div>
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
+        st.markdown(assistant_bubble(answer, can_answer, score, is_comprehensive), unsafe_allow_html=True)
 
         # ========== Reference 部分 ==========
         # 功能2（综合问题）：不显示任何reference
@@ -567,6 +611,8 @@ for i, msg in enumerate(st.session_state.messages):
                 ref_text = reference.get("text", "")
                 ref_page = reference.get("page", "?")
                 display_page = int(ref_page) + 1 if str(ref_page).isdigit() else ref_page
+                ref_clause = reference.get("clause")
+                clause_label = f"Clause {ref_clause} · " if ref_clause else ""
                 
                 with st.expander("📄 View Source", expanded=False):
                     st.markdown(
@@ -576,7 +622,7 @@ for i, msg in enumerate(st.session_state.messages):
                                     box-shadow:0 4px 12px rgba(59,130,246,0.2);">
                             <div style="font-size:1rem; font-weight:600;">📍 Contract Reference</div>
                             <div style="margin-top:0.5rem; opacity:0.95; font-size:0.9rem;">
-                                Page {display_page}
+                                {clause_label}Page {display_page}
                             </div>
                         </div>
                         """,
@@ -606,8 +652,29 @@ user_input = st.chat_input("Ask anything about your tenancy agreement...")
 if user_input:
     st.session_state.show_modal = False
     st.session_state.messages.append({"role": "user", "content": user_input})
+    st.markdown(user_bubble(user_input), unsafe_allow_html=True)
+
+    # Stream: the can-answer decision arrives first, then answer tokens as they are generated
+    stream = chat.ask_stream(user_input)
     with st.spinner("Searching..."):
-        res = chat.ask(user_input)
+        res = next(stream)
+    placeholder = st.empty()
+    placeholder.markdown(
+        assistant_bubble(res.get("answer") or "▌", res.get("can_answer", True),
+                         res.get("score", 1.0), res.get("is_comprehensive", False)),
+        unsafe_allow_html=True
+    )
+    answer = ""
+    for item in stream:
+        if isinstance(item, dict):
+            res = item          # final result (or error) replaces the partial one
+            continue
+        answer += item
+        placeholder.markdown(
+            assistant_bubble(answer + "▌", res.get("can_answer", True),
+                             res.get("score", 1.0), res.get("is_comprehensive", False)),
+            unsafe_allow_html=True
+        )
     st.session_state.messages.append({"role": "assistant", "content": res})
     st.rerun()
 
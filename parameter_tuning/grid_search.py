@@ -73,6 +73,8 @@ TOP_K_RETRIEVAL = 10
 TOP_K_CONTEXT = 3
 USE_MMR = False
 MMR_LAMBDA = 0.7
+SEARCH_DIMENSIONS = None
+CHUNKER = "recursive"   # the sweep varies CHUNK_SIZE / CHUNK_OVERLAP
 
 THRESHOLD_CAN_ANSWER = {threshold}
 """
@@ -81,26 +83,39 @@ THRESHOLD_CAN_ANSWER = {threshold}
         f.write(config_content)
 
 
+def reload_src_modules():
+    """清掉 src.*，让刚写入的 config.py 生效；先关掉旧模块的进程池/线程池，否则它们被丢下没人管"""
+    for name, close in (('src.loader', 'shutdown_pool'), ('src.embedding_cache', 'shutdown')):
+        if name in sys.modules:
+            getattr(sys.modules[name], close)()
+    for module in list(sys.modules.keys()):
+        if module.startswith('src.'):
+            del sys.modules[module]
+
+
 def rebuild_vector_store():
-    """重建向量存储"""
-    print("      重建向量存储...", end="", flush=True)
-    if os.path.exists('vector_store'):
-        shutil.rmtree('vector_store')
-    ret = os.system('python -m src.embedder > /dev/null 2>&1')
-    if ret == 0:
+    """准备当前配置的向量存储（目录按配置指纹区分：建过的直接复用，不删除其它配置）"""
+    print("      准备向量存储...", end="", flush=True)
+    reload_src_modules()
+    from src.chat import get_active_pdf
+    from src.retriever import ensure_store
+    try:
+        ensure_store(get_active_pdf())
         print(" ✅")
-    else:
-        print(" ❌")
+    except Exception as e:
+        print(f" ❌ {e}")
 
 
 def test_configuration():
     """测试当前配置"""
-    # 清除缓存的模块
-    for module in list(sys.modules.keys()):
-        if module.startswith('src.'):
-            del sys.modules[module]
+    reload_src_modules()
+    
+    from src.chat import answer, get_active_pdf
+    from src.retriever import search_many
     
-    from src.chat import ask
+    # 一次批量embedding所有问题（之后的answer()命中查询缓存，不走BM25快速路径）
+    search_many([q for qs in TEST_CASES.values() for q in qs], top_k=1,
+                active_pdf_path=get_active_pdf())
     
     results = []
     correct = 0
@@ -109,7 +124,8 @@ def test_configuration():
     for expected, questions in TEST_CASES.items():
         for question in questions:
             try:
-                response = ask(question)
+                # answer() 不经过FAQ/答案缓存：评估的是当前配置
+                response = answer(question, get_active_pdf())
                 can_answer = response.get('can_answer', True)
                 predicted = 'CanAnswer' if can_answer else 'CannotAnswer'
                 is_correct = (predicted == expected)
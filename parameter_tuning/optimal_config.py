@@ -34,4 +34,6 @@ THRESHOLD_MEDIUM = 0.8
 # ========== OPTIMIZED ADVANCED SETTINGS ==========
 USE_MMR = True
 MMR_LAMBDA = 0.7
+SEARCH_DIMENSIONS = None
+CHUNKER = "recursive"
 SCORE_GAP_THRESHOLD = 0.05
@@ -12,7 +12,7 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.retriever import search
+from src.retriever import search_many
 import json
 import numpy as np
 import matplotlib.pyplot as plt
@@ -67,16 +67,17 @@ def analyze_score_distribution():
     detailed_results = []
     
     print("🔍 正在检索所有测试问题...")
+    # 一次批量embedding + 一次矩阵打分，再和BM25融合（分数同 search(..., with_scores=True)）
+    all_questions = [q for qs in TEST_CASES.values() for q in qs]
+    batched_results = dict(zip(
+        all_questions,
+        search_many(all_questions, top_k=5, active_pdf_path=pdf_path)
+    ))
     for expected_confidence, questions in TEST_CASES.items():
         print(f"\n处理 {expected_confidence} 类别...")
         for question in questions:
             try:
-                results = search(
-                    question,
-                    top_k=5,
-                    with_scores=True,
-                    active_pdf_path=pdf_path
-                )
+                results = batched_results[question]
                 
                 if results:
                     top_score = results[0].metadata.get('score', 1.0)
@@ -78,6 +78,8 @@ TOP_K_RETRIEVAL = 10
 TOP_K_CONTEXT = 3
 USE_MMR = False
 MMR_LAMBDA = 0.7
+SEARCH_DIMENSIONS = None
+CHUNKER = "recursive"   # the sweep varies CHUNK_SIZE / CHUNK_OVERLAP
 
 # Confidence threshold (BINARY CLASSIFICATION)
 THRESHOLD_CAN_ANSWER = {threshold}
@@ -87,17 +89,28 @@ THRESHOLD_CAN_ANSWER = {threshold}
         f.write(config_content)
 
 
+def reload_src_modules():
+    """清掉 src.*，让刚写入的 config.py 生效；先关掉旧模块的进程池/线程池，否则它们被丢下没人管"""
+    for name, close in (('src.loader', 'shutdown_pool'), ('src.embedding_cache', 'shutdown')):
+        if name in sys.modules:
+            getattr(sys.modules[name], close)()
+    for module in list(sys.modules.keys()):
+        if module.startswith('src.'):
+            del sys.modules[module]
+
+
 def rebuild_vector_store():
-    """重建向量存储"""
-    print("    🔨 重建向量存储...")
-    if os.path.exists('vector_store'):
-        shutil.rmtree('vector_store')
-    os.system('python -m src.embedder > /dev/null 2>&1')
+    """准备当前配置的向量存储（目录按配置指纹区分：建过的直接复用，不删除其它配置）"""
+    print("    🔨 准备向量存储...")
+    reload_src_modules()
+    from src.chat import get_active_pdf
+    from src.retriever import ensure_store
+    ensure_store(get_active_pdf())
 
 
 def test_configuration():
     """测试当前配置"""
-    from src.chat import ask
+    from src.chat import answer, get_active_pdf
     
     results = []
     correct = 0
@@ -106,7 +119,8 @@ def test_configuration():
     for expected, questions in TEST_CASES.items():
         for question in questions:
             try:
-                response = ask(question)
+                # answer() 不经过FAQ/答案缓存：评估的是当前配置
+                response = answer(question, get_active_pdf())
                 
                 can_answer = response.get('can_answer', True)
                 predicted = 'CanAnswer' if can_answer else 'CannotAnswer'
@@ -17,17 +17,8 @@ TEST_CHUNK_SIZE = 450
 TEST_CHUNK_OVERLAP = 100
 TEST_THRESHOLD = 0.65
 
-print("="*80)
-print(f"🧪 快速测试: chunk={TEST_CHUNK_SIZE}/{TEST_CHUNK_OVERLAP}, threshold={TEST_THRESHOLD}")
-print("="*80)
-
-# 1. 备份配置
-print("\n1️⃣  备份配置...")
-shutil.copy('src/config.py', 'src/config.py.test_backup')
-
-# 2. 写入测试配置
-print("2️⃣  写入测试配置...")
-config_content = f"""# src/config.py - TEMPORARY TEST CONFIG
+# 测试配置（main() 第2步写入 src/config.py）
+CONFIG_CONTENT = f"""# src/config.py - TEMPORARY TEST CONFIG
 import os
 from dotenv import load_dotenv
 
@@ -47,30 +38,12 @@ TOP_K_RETRIEVAL = 10
 TOP_K_CONTEXT = 3
 USE_MMR = False
 MMR_LAMBDA = 0.7
+SEARCH_DIMENSIONS = None
+CHUNKER = "recursive"   # this test varies CHUNK_SIZE / CHUNK_OVERLAP
 
 THRESHOLD_CAN_ANSWER = {TEST_THRESHOLD}
 """
 
-with open('src/config.py', 'w') as f:
-    f.write(config_content)
-
-# 3. 重建向量存储
-print("3️⃣  重建向量存储...")
-if os.path.exists('vector_store'):
-    shutil.rmtree('vector_store')
-os.system('python -m src.embedder')
-
-# 4. 运行测试
-print("\n4️⃣  运行测试...")
-print("="*80)
-
-# 清除模块缓存
-for module in list(sys.modules.keys()):
-    if module.startswith('src.'):
-        del sys.modules[module]
-
-from src.chat import ask
-
 TEST_CASES = {
     "CanAnswer": [
         "When is my rent due each month?",
@@ -95,68 +68,110 @@ TEST_CASES = {
     ]
 }
 
-correct = 0
-total = 0
-confusion = {"CanAnswer": {"CanAnswer": 0, "CannotAnswer": 0}, 
-             "CannotAnswer": {"CanAnswer": 0, "CannotAnswer": 0}}
 
-for expected, questions in TEST_CASES.items():
-    print(f"\n{'='*80}")
-    print(f"Testing {expected}")
+def main():
     print("="*80)
-    
-    for q in questions:
-        total += 1
-        try:
-            response = ask(q)
-            can_answer = response.get('can_answer', True)
-            predicted = 'CanAnswer' if can_answer else 'CannotAnswer'
-            score = response.get('score', 1.0)
-            
-            is_correct = (predicted == expected)
-            if is_correct:
-                correct += 1
-                symbol = "✅"
-            else:
-                symbol = "❌"
-            
-            confusion[expected][predicted] += 1
-            
-            print(f"{symbol} {q[:60]}")
-            print(f"   Expected: {expected} | Got: {predicted} | Score: {score:.3f}")
-            
-        except Exception as e:
-            print(f"❌ {q[:60]}")
-            print(f"   Error: {str(e)}")
-
-accuracy = (correct / total) * 100
-
-# 结果
-print("\n" + "="*80)
-print("📊 RESULTS")
-print("="*80)
-
-print(f"\nConfusion Matrix:")
-print(f"                    Predicted")
-print(f"Actual        CanAnswer  CannotAnswer")
-print(f"CanAnswer         {confusion['CanAnswer']['CanAnswer']:2}          {confusion['CanAnswer']['CannotAnswer']:2}")
-print(f"CannotAnswer      {confusion['CannotAnswer']['CanAnswer']:2}          {confusion['CannotAnswer']['CannotAnswer']:2}")
-
-can_acc = confusion['CanAnswer']['CanAnswer'] / len(TEST_CASES['CanAnswer']) * 100
-cannot_acc = confusion['CannotAnswer']['CannotAnswer'] / len(TEST_CASES['CannotAnswer']) * 100
-
-print(f"\n📈 Overall Accuracy: {accuracy:.1f}%")
-print(f"   CanAnswer: {can_acc:.1f}%")
-print(f"   CannotAnswer: {cannot_acc:.1f}%")
-
-# 5. 恢复配置
-print("\n" + "="*80)
-print("5️⃣  恢复原始配置...")
-shutil.copy('src/config.py.test_backup', 'src/config.py')
-os.remove('src/config.py.test_backup')
-print("✅ 已恢复，测试配置已删除")
-print("="*80)
-
-print(f"\n💡 与0.70对比:")
-print(f"   Threshold 0.70: 75.0% (CanAnswer 89%, CannotAnswer 57%)")
-print(f"   Threshold {TEST_THRESHOLD}: {accuracy:.1f}% (CanAnswer {can_acc:.0f}%, CannotAnswer {cannot_acc:.0f}%)")
\ No newline at end of file
+    print(f"🧪 快速测试: chunk={TEST_CHUNK_SIZE}/{TEST_CHUNK_OVERLAP}, threshold={TEST_THRESHOLD}")
+    print("="*80)
+
+    # 1. 备份配置
+    print("\n1️⃣  备份配置...")
+    shutil.copy('src/config.py', 'src/config.py.test_backup')
+
+    # 2. 写入测试配置
+    print("2️⃣  写入测试配置...")
+
+    with open('src/config.py', 'w') as f:
+        f.write(CONFIG_CONTENT)
+
+    # 3. 准备向量存储（按配置指纹区分目录，同一配置建过就直接复用）
+    print("3️⃣  准备向量存储...")
+    from src.embedder import build_vector_store
+    build_vector_store('./data/tenancy_agreement.pdf')
+
+    # 4. 运行测试
+    print("\n4️⃣  运行测试...")
+    print("="*80)
+
+    # 清除模块缓存（先关掉旧模块的进程池/线程池）
+    for name, close in (('src.loader', 'shutdown_pool'), ('src.embedding_cache', 'shutdown')):
+        if name in sys.modules:
+            getattr(sys.modules[name], close)()
+    for module in list(sys.modules.keys()):
+        if module.startswith('src.'):
+            del sys.modules[module]
+
+    from src.chat import answer, get_active_pdf
+
+
+    correct = 0
+    total = 0
+    confusion = {"CanAnswer": {"CanAnswer": 0, "CannotAnswer": 0}, 
+                 "CannotAnswer": {"CanAnswer": 0, "CannotAnswer": 0}}
+
+    for expected, questions in TEST_CASES.items():
+        print(f"\n{'='*80}")
+        print(f"Testing {expected}")
+        print("="*80)
+
+        for q in questions:
+            total += 1
+            try:
+                # answer() 不经过FAQ/答案缓存：评估的是当前配置
+                response = answer(q, get_active_pdf())
+                can_answer = response.get('can_answer', True)
+                predicted = 'CanAnswer' if can_answer else 'CannotAnswer'
+                score = response.get('score', 1.0)
+
+                is_correct = (predicted == expected)
+                if is_correct:
+                    correct += 1
+                    symbol = "✅"
+                else:
+                    symbol = "❌"
+
+                confusion[expected][predicted] += 1
+
+                print(f"{symbol} {q[:60]}")
+                print(f"   Expected: {expected} | Got: {predicted} | Score: {score:.3f}")
+
+            except Exception as e:
+                print(f"❌ {q[:60]}")
+                print(f"   Error: {str(e)}")
+
+    accuracy = (correct / total) * 100
+
+    # 结果
+    print("\n" + "="*80)
+    print("📊 RESULTS")
+    print("="*80)
+
+    print(f"\nConfusion Matrix:")
+    print(f"                    Predicted")
+    print(f"Actual        CanAnswer  CannotAnswer")
+    print(f"CanAnswer         {confusion['CanAnswer']['CanAnswer']:2}          {confusion['CanAnswer']['CannotAnswer']:2}")
+    print(f"CannotAnswer      {confusion['CannotAnswer']['CanAnswer']:2}          {confusion['CannotAnswer']['CannotAnswer']:2}")
+
+    can_acc = confusion['CanAnswer']['CanAnswer'] / len(TEST_CASES['CanAnswer']) * 100
+    cannot_acc = confusion['CannotAnswer']['CannotAnswer'] / len(TEST_CASES['CannotAnswer']) * 100
+
+    print(f"\n📈 Overall Accuracy: {accuracy:.1f}%")
+    print(f"   CanAnswer: {can_acc:.1f}%")
+    print(f"   CannotAnswer: {cannot_acc:.1f}%")
+
+    # 5. 恢复配置
+    print("\n" + "="*80)
+    print("5️⃣  恢复原始配置...")
+    shutil.copy('src/config.py.test_backup', 'src/config.py')
+    os.remove('src/config.py.test_backup')
+    print("✅ 已恢复，测试配置已删除")
+    print("="*80)
+
+    print(f"\n💡 与0.70对比:")
+    print(f"   Threshold 0.70: 75.0% (CanAnswer 89%, CannotAnswer 57%)")
+    print(f"   Threshold {TEST_THRESHOLD}: {accuracy:.1f}% (CanAnswer {can_acc:.0f}%, CannotAnswer {cannot_acc:.0f}%)")
+
+
+# spawn 的子进程（src/loader.py 的提取进程池）会重新 import 本脚本：顶层只放定义
+if __name__ == "__main__":
+    main()
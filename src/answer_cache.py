@@ -0,0 +1,173 @@
+# src/answer_cache.py
+"""
+Semantic answer cache in front of chat.ask.
+
+Tenants on one contract ask the same few questions in many phrasings. An
+answer dict (answer, reference, score, ...) is cached per contract scope —
+retriever.store_key(pdf): content signature + index fingerprint — and found
+again by
+
+  1. exact normalized text (unicode/whitespace/case, trailing punctuation)
+  2. cosine similarity of the query embedding >= ANSWER_CACHE_SIMILARITY
+     against earlier queries in the same scope (one mat-vec). The vector
+     comes from query_vector(): embedded only if retrieval would embed the
+     query anyway (the search then reuses it), so a lexical fast-path
+     question still costs no API call
+
+Entries expire after ANSWER_CACHE_TTL_SECONDS and the least recently used
+are evicted past ANSWER_CACHE_MAX_ENTRIES. When a PDF path's content
+changes, its store key changes: lookups never see the old answers, and the
+old scope is dropped the first time the new one is used. Failed answers
+(an "error" key) are not cached.
+"""
+
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.embedding_cache import get_embeddings, normalize_query
+from src import retriever
+from src.chat_multi import needs_comprehensive_answer
+
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))   # cosine similarity cutoff
+
+_TRAILING_PUNCT = re.compile(r"[\s?？!！.。,，]+$")
+
+
+def cache_text(query: str) -> str:
+    """Exact-match key: normalized, case-folded, without trailing punctuation."""
+    return _TRAILING_PUNCT.sub("", normalize_query(query).casefold())
+
+
+class _Entry:
+    def __init__(self, scope: str, text: str, vec: Optional[np.ndarray], response: dict):
+        self.scope = scope
+        self.text = text
+        self.vec = vec                  # None: answered without a query embedding, exact hits only
+        self.response = response
+        self.created = time.time()
+
+
+class AnswerCache:
+    def __init__(self, ttl: float = ANSWER_CACHE_TTL_SECONDS, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._matrices: Dict[str, Tuple[List[Tuple[str, str]], np.ndarray]] = {}   # scope -> (keys, vectors)
+        self._scopes: Dict[str, str] = {}          # pdf path -> current scope
+        self._lock = threading.Lock()
+
+    # ---------- internals (lock held) ----------
+    def _drop(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._matrices.pop(entry.scope, None)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for key in [k for k, e in self._entries.items() if e.created < cutoff]:
+            self._drop(key)
+
+    def _switch_scope(self, pdf_path: str, scope: str):
+        old = self._scopes.get(pdf_path)
+        if old is not None and old != scope:
+            # the contract changed: its old answers can never be hit again
+            for key in [k for k in self._entries if k[0] == old]:
+                self._drop(key)
+            print(f"[answer_cache] Contract changed, dropped answers for {old}")
+        self._scopes[pdf_path] = scope
+
+    def _matrix(self, scope: str) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+        if scope not in self._matrices:
+            keys = [k for k, e in self._entries.items() if k[0] == scope and e.vec is not None]
+            vecs = np.stack([self._entries[k].vec for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+            self._matrices[scope] = (keys, vecs)
+        return self._matrices[scope]
+
+    def _hit(self, key: Tuple[str, str], how: str, t0: float) -> dict:
+        self._entries.move_to_end(key)
+        entry = self._entries[key]
+        print(f"[answer_cache] Hit ({how}): {entry.text!r} in {(time.perf_counter() - t0) * 1e3:.1f}ms")
+        return dict(copy.deepcopy(entry.response), cached=True)
+
+    # ---------- public ----------
+    def get(self, pdf_path: str, scope: str, query: str, vec: Optional[List[float]] = None) -> Optional[dict]:
+        t0 = time.perf_counter()
+        text = cache_text(query)
+        with self._lock:
+            self._switch_scope(pdf_path, scope)
+            self._expire()
+            if (scope, text) in self._entries:
+                return self._hit((scope, text), "exact", t0)
+            if vec is None:
+                return None
+            keys, mat = self._matrix(scope)
+            if not keys:
+                return None
+            q = np.asarray(vec, dtype=np.float32)
+            sims = mat @ (q / (np.linalg.norm(q) or 1.0))
+            best = int(np.argmax(sims))
+            if sims[best] < self.similarity:
+                return None
+            return self._hit(keys[best], f"similarity {sims[best]:.3f}", t0)
+
+    def put(self, pdf_path: str, scope: str, query: str, vec: Optional[List[float]], response: dict):
+        if response.get("error"):
+            return
+        v = None
+        if vec is not None:
+            v = np.asarray(vec, dtype=np.float32)
+            v = v / (np.linalg.norm(v) or 1.0)
+        key = (scope, cache_text(query))
+        response = {k: val for k, val in response.items() if k != "cached"}
+        with self._lock:
+            self._switch_scope(pdf_path, scope)
+            self._drop(key)
+            self._entries[key] = _Entry(scope, key[1], v, copy.deepcopy(response))
+            self._matrices.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+_CACHE = AnswerCache()
+
+
+def query_vector(query: str, pdf_path: str) -> Optional[List[float]]:
+    """
+    The query's embedding if answering it uses one anyway: cached, or embedded
+    now when retrieval would embed it (the search then finds it in the
+    embedding cache). None on the BM25 fast path or while the index builds.
+    """
+    embeddings = get_embeddings()
+    vec = embeddings.peek_query(query)
+    if vec is None and retriever.will_embed_query(
+            query, active_pdf_path=pdf_path, fast_path=not needs_comprehensive_answer(query)):
+        vec = embeddings.embed_query(query)
+    return vec
+
+
+def lookup(query: str, pdf_path: str) -> Optional[dict]:
+    """Cached answer dict for this query on this contract (exact or similar phrasing), else None."""
+    scope = retriever.store_key(pdf_path)
+    hit = _CACHE.get(pdf_path, scope, query)
+    if hit is not None:
+        return hit
+    vec = query_vector(query, pdf_path)
+    return _CACHE.get(pdf_path, scope, query, vec) if vec is not None else None
+
+
+def store(query: str, pdf_path: str, response: dict):
+    """Remember an answer; skipped while the contract's dense index is still building (keyword-only answers)."""
+    if not retriever.is_store_ready(pdf_path):
+        return
+    # the vector exists if retrieval used one; a fast-path answer is kept for exact hits
+    _CACHE.put(pdf_path, retriever.store_key(pdf_path), query, get_embeddings().peek_query(query), response)
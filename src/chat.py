@@ -4,32 +4,32 @@
 使用二分类：能答/不能答
 """
 
-from openai import OpenAI
-from src.retriever import search  
-from src.config import OPENAI_API_KEY, TOP_K_RETRIEVAL, TOP_K_CONTEXT, THRESHOLD_CAN_ANSWER
-from src.chat_multi import ask_comprehensive, needs_comprehensive_answer
+from src.openai_client import get_async_client, get_client
+from src.retriever import search, will_embed_query
+from src.config import CHAT_MODEL, TOP_K_RETRIEVAL, TOP_K_CONTEXT, THRESHOLD_CAN_ANSWER
+from src.chat_multi import (
+    ask_comprehensive, ask_comprehensive_async, ask_comprehensive_stream, comprehensive_config,
+    needs_comprehensive_answer
+)
+from src.embedding_cache import get_embeddings
+from src.context_packer import CONTEXT_TOKEN_BUDGET, pack
+from src.signature import file_signature
+from src import answer_cache, faq_answers
+import asyncio
 import re
-import hashlib
 from typing import Dict, Any
 
 # OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = get_client()   # 进程内共享的连接池（超时 + 重试，见 src/openai_client.py）
 
 # Active contract management
 _ACTIVE_PDF_PATH = "./data/tenancy_agreement.pdf"
 _ACTIVE_HASH = None
 
-def _md5(path: str) -> str:
-    try:
-        with open(path, "rb") as f:
-            return hashlib.md5(f.read()).hexdigest()
-    except Exception:
-        return "no-file"
-
 def set_active_pdf(path: str):
     global _ACTIVE_PDF_PATH, _ACTIVE_HASH
     _ACTIVE_PDF_PATH = path
-    _ACTIVE_HASH = _md5(path)
+    _ACTIVE_HASH = file_signature(path)
     print(f"[chat] Active PDF set to: {_ACTIVE_PDF_PATH}")
 
 def get_active_pdf() -> str:
@@ -38,7 +38,7 @@ def get_active_pdf() -> str:
 def debug_info() -> Dict[str, Any]:
     return {
         "pdf_path": _ACTIVE_PDF_PATH,
-        "pdf_sig": _ACTIVE_HASH or _md5(_ACTIVE_PDF_PATH),
+        "pdf_sig": _ACTIVE_HASH or file_signature(_ACTIVE_PDF_PATH),
     }
 
 # System prompt (功能1用)
@@ -58,15 +58,37 @@ Answer format:
 If the contract doesn't specify something, clearly state: "The agreement does not specify this."
 """
 
+USER_PROMPT = """Question: {query}
+
+Relevant Contract Clauses:
+{context}
+
+Please provide a clear, accurate answer based on these clauses."""
+
+GPT_SETTINGS = dict(model=CHAT_MODEL, temperature=0.1, max_tokens=500)
+
 
-def format_context(results, max_clauses=TOP_K_CONTEXT):
-    """Format retrieved clauses for LLM consumption."""
+def answer_config() -> dict:
+    """决定 answer() 结果的全部设置（预生成的FAQ答案按它区分，改了任何一项都会重新生成）"""
+    return {
+        "threshold_can_answer": THRESHOLD_CAN_ANSWER,
+        "top_k_retrieval": TOP_K_RETRIEVAL,
+        "top_k_context": TOP_K_CONTEXT,
+        "context_token_budget": CONTEXT_TOKEN_BUDGET,
+        "system_prompt": SYSTEM_PROMPT,
+        "user_prompt": USER_PROMPT,
+        "gpt": GPT_SETTINGS,
+        "comprehensive": comprehensive_config(),
+    }
+
+
+def format_context(results, max_clauses=TOP_K_CONTEXT, budget=CONTEXT_TOKEN_BUDGET):
+    """Format retrieved clauses for LLM consumption (merged, deduped, within `budget` tokens)."""
     context_parts = []
-    for i, doc in enumerate(results[:max_clauses], 1):
+    for i, doc in enumerate(pack(results[:max_clauses], budget), 1):
         page = doc.metadata.get("page", "?")
-        text = doc.page_content.strip()
-        text = re.sub(r'\s+', ' ', text)
-        context_parts.append(f"[Clause {i} - Page {page}]\n{text}")
+        clause = doc.metadata.get("clause_id", i)
+        context_parts.append(f"[Clause {clause} - Page {page}]\n{doc.page_content}")
     return "\n\n".join(context_parts)
 
 
@@ -81,47 +103,23 @@ def extract_reference(results):
 
     return {
         "text": clause_text,
-        "page": page
+        "page": page,
+        "clause": main_doc.metadata.get("clause_id")
     }
 
 
-def ask(query: str):
+def _prepare(query: str, pdf_path: str):
     """
-    主入口函数 - 自动选择功能1或功能2
-    
-    功能1：单条款回答（普通问题）
-    功能2：多RAG综合回答（综合性问题）
-    
-    Returns:
-        dict with keys:
-        - can_answer: bool
-        - answer: str
-        - reference: dict or None
-        - show_cta: bool
-        - score: float
-        - is_comprehensive: bool (if功能2)
-        - num_clauses_used: int (if功能2)
-        - topics_covered: list (if功能2)
+    功能1：检索 + 能否回答的判断 + 构建prompt（不调用GPT）
+
+    Returns (response, request)；request 为 None 时 response 即最终结果。
     """
-    
-    print(f"\n[chat] " + "="*50)
-    print(f"[chat] 💬 Query: {query}")
-    print(f"[chat] " + "="*50)
-    
-    # ========== 判断：需要综合回答吗？ ==========
-    if needs_comprehensive_answer(query):
-        print(f"[chat] 🎯 使用功能2：多RAG综合回答")
-        return ask_comprehensive(query, _ACTIVE_PDF_PATH)
-    
-    # ========== 功能1：普通单条款回答 ==========
-    print(f"[chat] 📌 使用功能1：单条款回答")
-    
     # 1) Retrieve relevant clauses
     results = search(
         query,
         top_k=TOP_K_RETRIEVAL,
         with_scores=True,
-        active_pdf_path=_ACTIVE_PDF_PATH,
+        active_pdf_path=pdf_path,
     )
 
     if not results:
@@ -132,10 +130,10 @@ def ask(query: str):
             "show_cta": True,
             "score": 1.0,
             "is_comprehensive": False
-        }
+        }, None
 
     # 2) Calculate confidence
-    best_score = results[0].metadata.get("score", 1.0)
+    best_score = min(r.metadata.get("score", 1.0) for r in results)
     print(f"[chat] 📊 Score: {best_score:.3f}")
     
     # ===== 不能回答 =====
@@ -151,56 +149,215 @@ def ask(query: str):
             "show_cta": True,
             "score": best_score,
             "is_comprehensive": False
-        }
+        }, None
 
     # ===== 能回答 =====
     print(f"[chat] ✅ 可以回答 (score < {THRESHOLD_CAN_ANSWER})")
     
     # 3) Prepare context for LLM
     context = format_context(results, max_clauses=TOP_K_CONTEXT)
-    user_prompt = f"""Question: {query}
+    user_prompt = USER_PROMPT.format(query=query, context=context)
 
-Relevant Contract Clauses:
-{context}
+    # 4) Attach reference (available before the answer, so streaming can show it first)
+    response = {
+        "can_answer": True,
+        "answer": "",
+        "reference": extract_reference(results),
+        "show_cta": False,
+        "score": best_score,
+        "is_comprehensive": False
+    }
+    request = dict(
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        **GPT_SETTINGS
+    )
+    return response, request
 
-Please provide a clear, accurate answer based on these clauses."""
 
-    # 4) Call GPT
+def _failed(response, e):
+    print(f"[chat] ❌ API Error: {str(e)}")
+    return {
+        "can_answer": False,
+        "answer": "生成答案时出现技术问题，请稍后重试。",
+        "reference": None,
+        "show_cta": True,
+        "score": response["score"],
+        "is_comprehensive": False,
+        "error": str(e)
+    }
+
+
+def _log_query(query: str):
+    print(f"\n[chat] " + "="*50)
+    print(f"[chat] 💬 Query: {query}")
+    print(f"[chat] " + "="*50)
+
+
+def ask(query: str):
+    """
+    主入口函数 - 自动选择功能1或功能2
+    
+    功能1：单条款回答（普通问题）
+    功能2：多RAG综合回答（综合性问题）
+    
+    Returns:
+        dict with keys:
+        - can_answer: bool
+        - answer: str
+        - reference: dict or None
+        - show_cta: bool
+        - score: float
+        - is_comprehensive: bool (if功能2)
+        - num_clauses_used: int (if功能2)
+        - topics_covered: list (if功能2)
+        - cached: True (if served from the answer cache or precomputed FAQ answers)
+        - faq: True (if served from precomputed FAQ answers)
+    """
+    _log_query(query)
+
+    # ========== FAQ（建索引时预先生成）或同一合同上问过的问题：直接返回 ==========
+    cached = _cached_answer(query, _ACTIVE_PDF_PATH)
+    if cached is not None:
+        return cached
+    response = answer(query, _ACTIVE_PDF_PATH)
+    answer_cache.store(query, _ACTIVE_PDF_PATH, response)
+    return response
+
+
+def _cached_answer(query: str, pdf_path: str):
+    return faq_answers.lookup(query, pdf_path) or answer_cache.lookup(query, pdf_path)
+
+
+def answer(query: str, pdf_path: str):
+    """检索 + GPT 回答指定合同上的一个问题，不经过任何缓存（ask() 和 FAQ 预生成共用）"""
+    # ========== 判断：需要综合回答吗？ ==========
+    if needs_comprehensive_answer(query):
+        print(f"[chat] 🎯 使用功能2：多RAG综合回答")
+        return ask_comprehensive(query, pdf_path)
+    
+    # ========== 功能1：普通单条款回答 ==========
+    print(f"[chat] 📌 使用功能1：单条款回答")
+    response, request = _prepare(query, pdf_path)
+    if request is None:
+        return response
+
+    # Call GPT
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.1,
-            max_tokens=500
-        )
-        answer_text = response.choices[0].message.content.strip()
-        print(f"[chat] 📝 Answer generated")
-        
+        completion = client.chat.completions.create(**request)
+        return _answered(response, completion)
     except Exception as e:
-        print(f"[chat] ❌ API Error: {str(e)}")
-        return {
-            "can_answer": False,
-            "answer": "生成答案时出现技术问题，请稍后重试。",
-            "reference": None,
-            "show_cta": True,
-            "score": best_score,
-            "is_comprehensive": False,
-            "error": str(e)
-        }
+        return _failed(response, e)
 
-    # 5) Attach reference
-    reference = extract_reference(results)
-    
+
+def _answered(response, completion):
+    answer_text = completion.choices[0].message.content.strip()
+    print(f"[chat] 📝 Answer generated (prompt tokens: {completion.usage.prompt_tokens})")
     print(f"[chat] ✅ Response complete\n")
-    
-    return {
-        "can_answer": True,
-        "answer": answer_text,
-        "reference": reference,
-        "show_cta": False,
-        "score": best_score,
-        "is_comprehensive": False
-    }
\ No newline at end of file
+    return dict(response, answer=answer_text)
+
+
+async def ask_async(query: str):
+    """
+    ask() 的异步版本，返回值相同；一个进程可以同时处理很多个问题：
+
+        answers = await asyncio.gather(*(chat.ask_async(q) for q in questions))
+
+    等待OpenAI（query embedding、GPT）时不占线程，用 AsyncOpenAI；
+    阻塞的检索、缓存查找放到线程池执行。同步调用方（app.py、测试脚本）继续用 ask()。
+    """
+    _log_query(query)
+    pdf_path = _ACTIVE_PDF_PATH
+
+    # 缓存查找和检索要用的query向量在事件循环上先取（之后都命中embedding缓存）
+    await _embed_if_needed(query, pdf_path)
+    cached = await asyncio.to_thread(_cached_answer, query, pdf_path)
+    if cached is not None:
+        return cached
+    response = await answer_async(query, pdf_path)
+    await asyncio.to_thread(answer_cache.store, query, pdf_path, response)
+    return response
+
+
+async def _embed_if_needed(query: str, pdf_path: str):
+    # 检索要调用embedding API时才用AsyncOpenAI先取query向量；BM25快速路径、
+    # 已缓存的向量都不需要，和 ask() 一样不多发请求
+    if await asyncio.to_thread(will_embed_query, query, active_pdf_path=pdf_path,
+                               fast_path=not needs_comprehensive_answer(query)):
+        await get_embeddings().aembed_query(query)
+
+
+async def answer_async(query: str, pdf_path: str):
+    """answer() 的异步版本（不经过任何缓存）"""
+    if needs_comprehensive_answer(query):
+        print(f"[chat] 🎯 使用功能2：多RAG综合回答（异步）")
+        return await ask_comprehensive_async(query, pdf_path)
+
+    print(f"[chat] 📌 使用功能1：单条款回答（异步）")
+    await _embed_if_needed(query, pdf_path)
+    response, request = await asyncio.to_thread(_prepare, query, pdf_path)
+    if request is None:
+        return response
+
+    try:
+        completion = await get_async_client().chat.completions.create(**request)
+        return _answered(response, completion)
+    except Exception as e:
+        return _failed(response, e)
+
+
+def ask_stream(query: str):
+    """
+    ask() 的流式版本，用于边生成边显示答案。
+
+    依次yield：
+    - dict：能否回答的判断和reference（answer为空；不能回答时即最终结果）
+    - str：答案片段（token），GPT生成一段就返回一段
+    - dict：最终结果，与 ask() 的返回值相同（GPT失败时为错误信息）
+
+    最后一个dict即完整结果，可直接存入聊天记录。
+    命中FAQ或答案缓存时只yield一个dict（完整结果）。
+    """
+    _log_query(query)
+
+    cached = _cached_answer(query, _ACTIVE_PDF_PATH)
+    if cached is not None:
+        yield cached
+        return
+
+    final = None
+    for item in _ask_stream(query):
+        if isinstance(item, dict):
+            final = item
+        yield item
+    if final is not None:
+        answer_cache.store(query, _ACTIVE_PDF_PATH, final)
+
+
+def _ask_stream(query: str):
+    if needs_comprehensive_answer(query):
+        print(f"[chat] 🎯 使用功能2：多RAG综合回答（流式）")
+        yield from ask_comprehensive_stream(query, _ACTIVE_PDF_PATH)
+        return
+
+    print(f"[chat] 📌 使用功能1：单条款回答（流式）")
+    response, request = _prepare(query, _ACTIVE_PDF_PATH)
+    yield response
+    if request is None:
+        return
+
+    parts = []
+    try:
+        for chunk in client.chat.completions.create(**request, stream=True):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        yield _failed(response, e)
+        return
+
+    print(f"[chat] ✅ Response complete (streamed)\n")
+    yield dict(response, answer="".join(parts).strip())
@@ -4,16 +4,20 @@
 用于需要综合多个条款的复杂问题
 """
 
-from openai import OpenAI
-from src.retriever import search
-from src.config import OPENAI_API_KEY, THRESHOLD_CAN_ANSWER
+from src.openai_client import get_async_client, get_client
+from src.embedding_cache import get_embeddings
+from src.retriever import route_topics, search, search_range, will_embed_query
+from src.config import CHAT_MODEL, THRESHOLD_CAN_ANSWER
+from src.context_packer import COMPREHENSIVE_CONTEXT_TOKEN_BUDGET, pack
+import asyncio
 import re
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = get_client()   # 进程内共享的连接池（超时 + 重试，见 src/openai_client.py）
 
 # 功能2的专用参数
 RELEVANCE_THRESHOLD = 0.80  # 收集相关chunks的阈值（比0.65宽松）
-TOP_K_COMPREHENSIVE = 50    # 检索的候选数量
+TOP_K_COMPREHENSIVE = 50    # 收集相关chunks的上限
+PROBE_K = 5                 # 第一阶段：只取少量候选判断能否回答
 
 # System prompt for comprehensive answers
 COMPREHENSIVE_SYSTEM_PROMPT = """You are a professional tenancy agreement assistant.
@@ -44,12 +48,42 @@ Answer format for "Who is responsible" questions:
 - [Item 2]
 """
 
+COMPREHENSIVE_USER_PROMPT = """Question: {query}
+
+I have found {num_clauses} relevant clauses from the tenancy agreement covering {num_topics} different topics.
+
+Please provide a COMPREHENSIVE answer that synthesizes ALL the information below:
+
+{context}
+
+Remember:
+- Include ALL relevant points from ALL clauses
+- Organize the answer clearly (use lists/categories)
+- Be thorough but concise
+- Use tenant-friendly language"""
+
+# 稍高的temperature允许更好的综合；综合答案可能更长
+COMPREHENSIVE_GPT_SETTINGS = dict(model=CHAT_MODEL, temperature=0.2, max_tokens=800)
+
+
+def comprehensive_config() -> dict:
+    """决定功能2结果的全部设置（见 chat.answer_config）"""
+    return {
+        "relevance_threshold": RELEVANCE_THRESHOLD,
+        "top_k_comprehensive": TOP_K_COMPREHENSIVE,
+        "probe_k": PROBE_K,
+        "context_token_budget": COMPREHENSIVE_CONTEXT_TOKEN_BUDGET,
+        "system_prompt": COMPREHENSIVE_SYSTEM_PROMPT,
+        "user_prompt": COMPREHENSIVE_USER_PROMPT,
+        "gpt": COMPREHENSIVE_GPT_SETTINGS,
+    }
+
 
 def format_comprehensive_context(relevant_chunks):
-    """格式化多个chunks给LLM"""
+    """格式化多个chunks给LLM（传入 context_packer.pack 的结果：已合并、去重、限定token预算）"""
     context_parts = []
     
-    # 按topic分组
+    # 按topic分组（topic在建索引时写入chunk metadata，见 src/topics.py）
     topics = {}
     for chunk in relevant_chunks:
         topic = chunk.metadata.get('topic', 'general')
@@ -59,43 +93,48 @@ def format_comprehensive_context(relevant_chunks):
     
     # 格式化
     for topic, chunks in topics.items():
-        context_parts.append(f"\n=== Topic: {topic.upper()} ===")
+        context_parts.append(f"\n=== Topic: {topic.replace('_', ' ').upper()} ===")
         for i, chunk in enumerate(chunks, 1):
             page = chunk.metadata.get('page', '?')
             score = chunk.metadata.get('score', 1.0)
+            label = chunk.metadata.get('clause_id') or i
             text = re.sub(r'\s+', ' ', chunk.page_content.strip())
-            context_parts.append(f"\n[Clause {i} - Page {page}, Relevance: {1-score:.2f}]\n{text}")
+            context_parts.append(f"\n[Clause {label} - Page {page}, Relevance: {1-score:.2f}]\n{text}")
     
     return "\n".join(context_parts)
 
 
-def ask_comprehensive(query: str, active_pdf_path: str):
+def _prepare_comprehensive(query: str, active_pdf_path: str):
     """
-    功能2：多RAG综合回答
-    
-    适用于需要综合多个条款的问题，如：
-    - "退房前要做什么？"
-    - "Who is responsible for repairs?"
-    - "What are my payment obligations?"
-    
+    检索 + 能否回答的判断 + 构建prompt（不调用GPT）
+
     Returns:
-        dict with:
-        - can_answer: bool
-        - answer: str
-        - num_clauses_used: int
-        - topics_covered: list
-        - is_comprehensive: True (标记这是综合回答)
+        (response, request)
+        - response: 返回给调用方的dict（能回答时answer为空，等GPT填充）
+        - request: chat.completions.create 的参数；None 表示无需调用GPT，response 即最终结果
     """
     
     print(f"\n[comprehensive] 🔍 处理综合性问题: {query}")
     
-    # 1. 检索大量候选
+    # 1. 路由到相关的topic分区，先只取少量候选（probe）
+    routed = route_topics(query, active_pdf_path=active_pdf_path)
     results = search(
         query,
-        top_k=TOP_K_COMPREHENSIVE,
+        top_k=PROBE_K,
         with_scores=True,
-        active_pdf_path=active_pdf_path
+        active_pdf_path=active_pdf_path,
+        topic_filter=routed
     )
+    if routed and (not results or min(r.metadata.get('score', 1.0) for r in results) >= THRESHOLD_CAN_ANSWER):
+        # 路由没命中：退回全库检索，保证能否回答的判断不变
+        print(f"[comprehensive] ⚠️  分区 {routed} 无足够相关结果，改为全库检索")
+        routed = None
+        results = search(
+            query,
+            top_k=PROBE_K,
+            with_scores=True,
+            active_pdf_path=active_pdf_path
+        )
     
     if not results:
         return {
@@ -104,10 +143,10 @@ def ask_comprehensive(query: str, active_pdf_path: str):
             "num_clauses_used": 0,
             "topics_covered": [],
             "is_comprehensive": True
-        }
+        }, None
     
     # 2. 先判断整体能否回答（用严格的0.65阈值）
-    best_score = results[0].metadata.get('score', 1.0)
+    best_score = min(r.metadata.get('score', 1.0) for r in results)
     print(f"[comprehensive] 📊 最佳匹配分数: {best_score:.3f}")
     
     if best_score >= THRESHOLD_CAN_ANSWER:
@@ -123,13 +162,16 @@ def ask_comprehensive(query: str, active_pdf_path: str):
             "is_comprehensive": True,
             "show_cta": True,
             "score": best_score
-        }
+        }, None
     
-    # 3. 能回答！收集所有相关的chunks（用宽松的0.80阈值）
-    relevant_chunks = [
-        r for r in results 
-        if r.metadata.get('score', 1.0) < RELEVANCE_THRESHOLD
-    ]
+    # 3. 能回答！范围检索：收集所有分数低于宽松0.80阈值的chunks（超过阈值即停止扩展）
+    relevant_chunks = search_range(
+        query,
+        RELEVANCE_THRESHOLD,
+        active_pdf_path=active_pdf_path,
+        topic_filter=routed,
+        max_k=TOP_K_COMPREHENSIVE
+    )
     
     print(f"[comprehensive] ✅ 找到 {len(relevant_chunks)} 个相关条款")
     
@@ -138,7 +180,11 @@ def ask_comprehensive(query: str, active_pdf_path: str):
         relevant_chunks = results[:3]
         print(f"[comprehensive] ⚠️  降级：使用top-3条款")
     
-    # 4. 统计覆盖的topics
+    # 4. 合并同页重叠/同条款的chunks，去重，按相关度填满token预算
+    relevant_chunks = pack(relevant_chunks, COMPREHENSIVE_CONTEXT_TOKEN_BUDGET)
+    num_clauses = sum(chunk.metadata.get('merged', 1) for chunk in relevant_chunks)
+    
+    # 统计覆盖的topics
     topics_covered = list(set(
         chunk.metadata.get('topic', 'general') 
         for chunk in relevant_chunks
@@ -150,50 +196,11 @@ def ask_comprehensive(query: str, active_pdf_path: str):
     context = format_comprehensive_context(relevant_chunks)
     
     # 6. 构建prompt
-    user_prompt = f"""Question: {query}
-
-I have found {len(relevant_chunks)} relevant clauses from the tenancy agreement covering {len(topics_covered)} different topics.
-
-Please provide a COMPREHENSIVE answer that synthesizes ALL the information below:
-
-{context}
-
-Remember:
-- Include ALL relevant points from ALL clauses
-- Organize the answer clearly (use lists/categories)
-- Be thorough but concise
-- Use tenant-friendly language"""
-    
-    # 7. 调用GPT生成综合答案
-    try:
-        print(f"[comprehensive] 🤖 调用GPT生成综合答案...")
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": COMPREHENSIVE_SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.2,  # 稍高一点，允许更好的综合
-            max_tokens=800    # 综合答案可能更长
-        )
-        
-        answer_text = response.choices[0].message.content.strip()
-        print(f"[comprehensive] ✅ 答案已生成 ({len(answer_text)} 字符)")
-        
-    except Exception as e:
-        print(f"[comprehensive] ❌ GPT调用失败: {str(e)}")
-        return {
-            "can_answer": False,
-            "answer": "生成答案时出现技术问题，请稍后重试或联系客服。",
-            "num_clauses_used": len(relevant_chunks),
-            "topics_covered": topics_covered,
-            "is_comprehensive": True,
-            "show_cta": True,
-            "error": str(e)
-        }
+    user_prompt = COMPREHENSIVE_USER_PROMPT.format(
+        query=query, num_clauses=num_clauses, num_topics=len(topics_covered), context=context
+    )
     
-    # 8. 构建引用信息（显示用了哪些页的条款）
+    # 7. 构建引用信息（显示用了哪些页的条款）
     pages_used = sorted(set(
         chunk.metadata.get('page', '?') 
         for chunk in relevant_chunks
@@ -201,20 +208,132 @@ Remember:
     
     reference_summary = {
         "pages": pages_used,
-        "num_clauses": len(relevant_chunks),
+        "num_clauses": num_clauses,
         "topics": topics_covered
     }
     
-    return {
+    response = {
         "can_answer": True,
-        "answer": answer_text,
+        "answer": "",
         "reference": reference_summary,
-        "num_clauses_used": len(relevant_chunks),
+        "num_clauses_used": num_clauses,
         "topics_covered": topics_covered,
         "is_comprehensive": True,
         "show_cta": False,
         "score": best_score
     }
+    request = dict(
+        messages=[
+            {"role": "system", "content": COMPREHENSIVE_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        **COMPREHENSIVE_GPT_SETTINGS
+    )
+    return response, request
+
+
+def _comprehensive_failed(response, e):
+    """GPT调用失败时返回的dict"""
+    print(f"[comprehensive] ❌ GPT调用失败: {str(e)}")
+    return {
+        "can_answer": False,
+        "answer": "生成答案时出现技术问题，请稍后重试或联系客服。",
+        "num_clauses_used": response["num_clauses_used"],
+        "topics_covered": response["topics_covered"],
+        "is_comprehensive": True,
+        "show_cta": True,
+        "error": str(e)
+    }
+
+
+def ask_comprehensive(query: str, active_pdf_path: str):
+    """
+    功能2：多RAG综合回答
+    
+    适用于需要综合多个条款的问题，如：
+    - "退房前要做什么？"
+    - "Who is responsible for repairs?"
+    - "What are my payment obligations?"
+    
+    Returns:
+        dict with:
+        - can_answer: bool
+        - answer: str
+        - num_clauses_used: int
+        - topics_covered: list
+        - is_comprehensive: True (标记这是综合回答)
+    """
+    response, request = _prepare_comprehensive(query, active_pdf_path)
+    if request is None:
+        return response
+    
+    # 调用GPT生成综合答案
+    try:
+        print(f"[comprehensive] 🤖 调用GPT生成综合答案...")
+        completion = client.chat.completions.create(**request)
+        return _comprehensive_answered(response, completion)
+    except Exception as e:
+        return _comprehensive_failed(response, e)
+
+
+async def ask_comprehensive_async(query: str, active_pdf_path: str):
+    """
+    功能2的异步版本（见 chat.ask_async），返回值与 ask_comprehensive 相同
+
+    等待OpenAI时不占线程：query embedding 和 GPT 用 AsyncOpenAI；
+    检索（Chroma / NumPy 扫描）放到线程池执行。
+    """
+    # 路由和范围检索都要query向量：需要请求API时先在事件循环上取，之后检索命中embedding缓存
+    if await asyncio.to_thread(will_embed_query, query, active_pdf_path=active_pdf_path, fast_path=False):
+        await get_embeddings().aembed_query(query)
+    response, request = await asyncio.to_thread(_prepare_comprehensive, query, active_pdf_path)
+    if request is None:
+        return response
+    
+    try:
+        print(f"[comprehensive] 🤖 调用GPT生成综合答案（异步）...")
+        completion = await get_async_client().chat.completions.create(**request)
+        return _comprehensive_answered(response, completion)
+    except Exception as e:
+        return _comprehensive_failed(response, e)
+
+
+def _comprehensive_answered(response, completion):
+    """GPT返回后的最终dict"""
+    answer_text = completion.choices[0].message.content.strip()
+    print(f"[comprehensive] ✅ 答案已生成 ({len(answer_text)} 字符, prompt tokens: {completion.usage.prompt_tokens})")
+    return dict(response, answer=answer_text)
+
+
+def ask_comprehensive_stream(query: str, active_pdf_path: str):
+    """
+    功能2的流式版本（见 chat.ask_stream）
+
+    依次yield：
+    - dict：检索结果和能否回答的判断（answer为空；不能回答时即最终结果）
+    - str：GPT生成的答案片段，边生成边返回
+    - dict：最终结果（answer为完整答案；GPT失败时为错误信息）
+    """
+    response, request = _prepare_comprehensive(query, active_pdf_path)
+    yield response
+    if request is None:
+        return
+    
+    parts = []
+    try:
+        print(f"[comprehensive] 🤖 流式生成综合答案...")
+        for chunk in client.chat.completions.create(**request, stream=True):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        yield _comprehensive_failed(response, e)
+        return
+    
+    answer_text = "".join(parts).strip()
+    print(f"[comprehensive] ✅ 答案已生成 ({len(answer_text)} 字符)")
+    yield dict(response, answer=answer_text)
 
 
 # 检测关键词：判断是否需要综合回答
@@ -0,0 +1,220 @@
+# src/clause_chunker.py
+"""
+Clause-aware chunking for numbered contracts.
+
+Tenancy agreements are organised as "2. The Tenant hereby agrees ..."
+followed by "(a) RENT", "(b) SECURITY DEPOSIT", ... A fixed-size character
+splitter cuts straight through those clauses and re-embeds its overlap
+text. ClauseChunker instead emits one chunk per (sub-)clause, with metadata
+
+    clause_id     "2(b)", "5(c)", "4(c)(ii)" — or "1" for a top-level clause
+    clause_title  the heading text, e.g. "SECURITY DEPOSIT"
+    tokens        exact token count (tiktoken, same encoding as the embedder)
+
+A short top-level intro ("2. The Tenant hereby agrees ... as follows:") is
+kept as a prefix of its first sub-clause instead of becoming a stub chunk.
+Clauses longer than CLAUSE_MAX_TOKENS are split at sentence boundaries, and
+each part repeats the heading so it stays self-contained. There is no
+overlap text.
+
+Chunks never span pages (incremental re-indexing replaces whole pages): a
+clause that continues onto the next page yields one chunk per page, both
+with the same clause_id. State is carried between consecutive pages, so
+feed pages in order through one instance per document. Pages without any
+clause numbering (preamble, signature block, schedules) fall back to the
+recursive character splitter.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.config import CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL
+from src.embed_executor import count_tokens
+
+CLAUSE_MAX_TOKENS = 400          # longer clauses are split at sentence boundaries
+CLAUSE_CHUNKER_VERSION = 1       # bump when chunk output changes: part of the store key
+INTRO_MAX_TOKENS = 60            # a shorter top-level intro is folded into its first sub-clause
+
+# "2. The Tenant ..." / "12. GOVERNING LAW" — a number followed by a dot at line start
+_TOP_RE = re.compile(r"^\s*(\d{1,2})\.\s+(\S.*)$")
+# "(b) SECURITY DEPOSIT" / "(aa) NO LIABILITY ..." / "(ii) ..."
+_SUB_RE = re.compile(r"^\s*\(([a-z]{1,2}|[ivx]{1,5})\)\s+(\S.*)$")
+# execution block / schedules end the numbered clauses
+_END_RE = re.compile(r"^\s*(IN WITNESS WHEREOF|SCHEDULE|ANNEX|APPENDIX)\b", re.IGNORECASE)
+_SENTENCE_RE = re.compile(r"(?<=[.;:])\s+")
+
+
+def _next_label(label: str) -> str:
+    """'a' -> 'b', 'z' -> 'aa', 'aa' -> 'bb' (the usual contract lettering)."""
+    if label == "z":
+        return "aa"
+    if len(label) == 2 and label[0] == label[1]:
+        return chr(ord(label[0]) + 1) * 2
+    return chr(ord(label[-1]) + 1) if len(label) == 1 else ""
+
+
+def _is_roman(label: str) -> bool:
+    return re.fullmatch(r"[ivx]+", label) is not None
+
+
+def has_top_level_heading(text: str) -> bool:
+    """True if a page opens a top-level clause — chunking can restart there without earlier pages."""
+    return any(_TOP_RE.match(line) or _END_RE.match(line) for line in text.splitlines())
+
+
+class _Clause:
+    def __init__(self, clause_id: Optional[str], title: str, heading: str):
+        self.clause_id = clause_id      # None: unnumbered text (execution block, schedules)
+        self.title = title
+        self.heading = heading          # first line, repeated on continuation parts
+        self.lines: List[str] = []
+
+
+class ClauseChunker:
+    """Stateful splitter: call split_documents() with one document's pages in order."""
+
+    def __init__(self, max_tokens: int = CLAUSE_MAX_TOKENS, model: str = EMBEDDING_MODEL):
+        self.max_tokens = max_tokens
+        self.model = model
+        self._fallback = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            separators=["\n\n", "\n", ". ", " ", ""],
+            add_start_index=True,       # context_packer merges touching chunks by position
+        )
+        self._reset()
+
+    def _reset(self):
+        self._last_page: Optional[int] = None
+        self._top: Optional[str] = None           # current top-level number
+        self._sub: Optional[str] = None           # current letter under it
+        self._open: Optional[_Clause] = None       # clause continuing onto the next page
+
+    # ---------- headings ----------
+    def _classify(self, line: str) -> Optional[Tuple[Optional[str], str]]:
+        """(clause_id, title) if the line opens a clause (clause_id None: numbering ends), else None."""
+        if _END_RE.match(line):
+            self._top, self._sub = None, None
+            return None, line.strip()
+        m = _TOP_RE.match(line)
+        if m:
+            self._top, self._sub = m.group(1), None
+            return self._top, m.group(2).strip()
+        m = _SUB_RE.match(line)
+        if m and self._top is not None:
+            label, title = m.group(1), m.group(2).strip()
+            # "(i)" after "(h)" is a letter; "(i)" right after "(c)" starts sub-sub-clauses
+            if self._sub is not None and _is_roman(label) and label != _next_label(self._sub):
+                return f"{self._top}({self._sub})({label})", title
+            self._sub = label
+            return f"{self._top}({label})", title
+        return None
+
+    # ---------- emit ----------
+    def _split_plain(self, doc: Document) -> List[Document]:
+        chunks = self._fallback.split_documents([doc])
+        for c in chunks:
+            c.metadata["tokens"] = count_tokens(c.page_content, self.model)
+        return chunks
+
+    def _parts(self, heading: str, body: str) -> List[str]:
+        """Split an over-long clause into parts of at most max_tokens, heading repeated."""
+        text = body.strip()
+        if count_tokens(text, self.model) <= self.max_tokens:
+            return [text]
+        parts, cur = [], ""
+        for sentence in _SENTENCE_RE.split(text):
+            candidate = f"{cur} {sentence}".strip() if cur else sentence
+            prefix = "" if not parts else heading + " (cont.)\n"
+            if cur and count_tokens(prefix + candidate, self.model) > self.max_tokens:
+                parts.append(prefix + cur)
+                cur = sentence
+            else:
+                cur = candidate
+        if cur:
+            parts.append(("" if not parts else heading + " (cont.)\n") + cur)
+        return parts
+
+    def _emit(self, clause: _Clause, page: Document, out: List[Document]):
+        body = "\n".join(clause.lines).strip()
+        if not body:
+            return
+        if clause.clause_id is None:
+            out.extend(self._split_plain(Document(page_content=body, metadata=dict(page.metadata))))
+            return
+        for i, text in enumerate(self._parts(clause.heading, body)):
+            meta = dict(page.metadata)
+            meta.update(clause_id=clause.clause_id, clause_title=clause.title,
+                        tokens=count_tokens(text, self.model))
+            if i:
+                meta["clause_part"] = i
+            out.append(Document(page_content=text, metadata=meta))
+
+    # ---------- public ----------
+    def split_page(self, page: Document) -> List[Document]:
+        page_no = page.metadata.get("page")
+        if self._last_page is None or page_no != self._last_page + 1:
+            self._reset()               # not the next page: nothing to carry over
+        self._last_page = page_no
+
+        clauses: List[_Clause] = []
+        if self._open is not None:
+            # text before the first heading continues the previous page's clause
+            cont = _Clause(self._open.clause_id, self._open.title, self._open.heading)
+            cont.lines = list(self._open.lines)     # a heading-only stub carried from the page bottom
+            clauses.append(cont)
+        else:
+            clauses.append(_Clause(None, "", ""))
+        for line in page.page_content.splitlines():
+            opened = self._classify(line)
+            if opened is not None:
+                clause_id, title = opened
+                clauses.append(_Clause(clause_id, title, line.strip()))
+            clauses[-1].lines.append(line)
+
+        if all(c.clause_id is None for c in clauses):
+            self._open = None
+            return self._split_plain(page)
+
+        out: List[Document] = []
+        last = clauses[-1]
+        # a heading at the very bottom of the page: carry it over instead of emitting a stub
+        carry = last.clause_id is not None and len([l for l in last.lines if l.strip()]) <= 1
+        for i, clause in enumerate(clauses):
+            if carry and clause is last:
+                break
+            nxt = clauses[i + 1] if i + 1 < len(clauses) else None
+            body = "\n".join(clause.lines)
+            if clause.clause_id is not None and "(" not in clause.clause_id and nxt is not None \
+                    and (nxt.clause_id or "").startswith(clause.clause_id + "(") \
+                    and count_tokens(body, self.model) <= INTRO_MAX_TOKENS:
+                nxt.lines.insert(0, body)       # fold the intro into its first sub-clause
+                continue
+            self._emit(clause, page, out)
+
+        if last.clause_id is None:
+            self._open = None
+        else:
+            self._open = _Clause(last.clause_id, last.title, last.heading)
+            if carry:
+                self._open.lines = last.lines
+        return out
+
+    def split_documents(self, pages: List[Document]) -> List[Document]:
+        out: List[Document] = []
+        for page in pages:
+            out.extend(self.split_page(page))
+        return out
+
+
+if __name__ == "__main__":
+    from src.loader import load_pdf_pages
+
+    chunks = ClauseChunker().split_documents(load_pdf_pages("./data/tenancy_agreement.pdf"))
+    print(f"Total chunks: {len(chunks)}, tokens: {sum(c.metadata.get('tokens', 0) for c in chunks)}")
+    for c in chunks:
+        m = c.metadata
+        print(f"p{m['page']} {m.get('clause_id', '-'):>10} {m.get('tokens', '?'):>4}  {m.get('clause_title', '')[:50]}")
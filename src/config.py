@@ -21,7 +21,13 @@ EMBEDDING_MODEL = "text-embedding-3-small"
 CHAT_MODEL = "gpt-4o-mini"
 
 # ========== CHUNKING PARAMETERS (OPTIMIZED) ==========
-# 基于网格搜索的最优值
+# "clause": 按条款编号切分（一条款一个 chunk，见 src/clause_chunker.py）
+# "recursive": 按 CHUNK_SIZE / CHUNK_OVERLAP 定长切分
+# THRESHOLD_CAN_ANSWER 是在 recursive 切分上网格搜索得到的；切换到 clause 前
+# 先用 test_classification.py 重新验证（必要时重新校准）阈值
+CHUNKER = "recursive"
+
+# 基于网格搜索的最优值（recursive 切分，以及 clause 模式下无条款编号的页）
 CHUNK_SIZE = 450
 CHUNK_OVERLAP = 100
 
@@ -38,6 +44,11 @@ RELEVANCE_THRESHOLD = 0.80    # 收集相关chunks的阈值（宽松）
 USE_MMR = False
 MMR_LAMBDA = 0.7
 
+# ========== MATRYOSHKA 截断维度 ==========
+# 新建的 store 只保存 embedding 前 N 维用于第一轮扫描，候选再用完整维度重排
+# None = 保存完整维度（1536）；可选 256 / 512
+SEARCH_DIMENSIONS = None
+
 # ========== CONFIDENCE THRESHOLD (BINARY CLASSIFICATION) ==========
 # 基于网格搜索的最优值：0.65
 # 准确率: 82.4% (CanAnswer: 78%, CannotAnswer: 86%)
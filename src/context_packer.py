@@ -0,0 +1,146 @@
+# src/context_packer.py
+"""
+Token-budgeted context assembly for the answer prompts.
+
+Retrieved chunks are not independent: the recursive splitter repeats up to
+CHUNK_OVERLAP characters between neighbours, a long clause comes back as
+several parts, and hybrid search can return the same text twice. pack():
+
+  1. drops duplicates and chunks whose text is contained in another hit
+  2. sorts the rest by position (page, clause, part, start_index) and, in one
+     pass, merges each chunk into the block before it when the two spans
+     overlap (suffix of one = prefix of the next) or touch, or are
+     consecutive parts of the same clause, so the shared text is sent once
+  3. fills the token budget in relevance order (best score first), skipping
+     blocks that no longer fit; tokens are counted with tiktoken for the
+     chat model
+
+Merged blocks are Documents carrying the best member's metadata (score =
+the best member's score) plus "merged": number of chunks in the block.
+"""
+
+import re
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from src.config import CHAT_MODEL
+from src.embed_executor import count_tokens
+
+CONTEXT_TOKEN_BUDGET = 1200               # 功能1: single-clause answers
+COMPREHENSIVE_CONTEXT_TOKEN_BUDGET = 2500  # 功能2: comprehensive answers
+HEADER_TOKENS = 16                        # "[Clause 2(b) - Page 3, Relevance: 0.71]" + separators
+MIN_OVERLAP_CHARS = 20                    # shorter suffix/prefix matches are coincidence
+ADJACENT_GAP_CHARS = 2                    # whitespace the splitter strips between touching chunks
+
+
+def _clean(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip())
+
+
+def _overlap(a: str, b: str, min_chars: int = MIN_OVERLAP_CHARS) -> int:
+    """Length of the longest suffix of a that is a prefix of b (0 if under min_chars)."""
+    for k in range(min(len(a), len(b)) - 1, min_chars - 1, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+
+class _Block:
+    def __init__(self, rank: int, doc: Document, text: str):
+        self.rank = rank                  # best (lowest) relevance rank among members
+        self.doc = doc                    # best member
+        self.text = text
+        self.members = 1
+        meta = doc.metadata
+        self.page = meta.get("page")
+        self.clause_id = meta.get("clause_id")
+        self.part = meta.get("clause_part", 0)          # last clause part in the block
+        self.start = meta.get("start_index")            # character span on the page, if the splitter recorded it
+        self.end = None if self.start is None else self.start + len(doc.page_content)
+
+    def join(self, other: "_Block", text: str):
+        if other.rank < self.rank:
+            self.rank, self.doc = other.rank, other.doc
+        self.text = text
+        self.members += other.members
+        self.part = max(self.part, other.part)
+        if self.end is not None and other.end is not None:
+            self.end = max(self.end, other.end)
+
+    def position(self) -> tuple:
+        page = -1 if self.page is None else self.page
+        start = -1 if self.start is None else self.start
+        return page, self.clause_id or "", self.part, start, self.rank
+
+
+def _continuation(a: _Block, b: _Block) -> Optional[str]:
+    """Merged text if b (next in position order) overlaps or directly follows a, else None."""
+    if a.page != b.page or a.clause_id != b.clause_id:
+        return None
+    if a.clause_id:
+        if b.part != a.part + 1:
+            return None
+        # continuation parts repeat the heading: "<heading> (cont.) ..."
+        rest = re.sub(r"^.*?\(cont\.\)\s*", "", b.text, count=1)
+        return f"{a.text} {rest}"
+    spans = a.end is not None and b.start is not None
+    # known to overlap on the page: any shared suffix/prefix is the overlap, however short
+    k = _overlap(a.text, b.text, 1 if spans and b.start < a.end else MIN_OVERLAP_CHARS)
+    if k:
+        return a.text + b.text[k:]
+    if spans and b.start <= a.end + ADJACENT_GAP_CHARS:
+        return f"{a.text} {b.text}"
+    return None
+
+
+def _truncate(text: str, budget: int, model: str) -> str:
+    """Longest word prefix of text within budget tokens."""
+    words = text.split(" ")
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid]), model) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo]) + " ..."
+
+
+def pack(docs: List[Document], budget: int = CONTEXT_TOKEN_BUDGET, model: str = CHAT_MODEL) -> List[Document]:
+    """Merge, dedupe and budget `docs` (given in relevance order); returns the blocks in that order."""
+    blocks: List[_Block] = []
+    for rank, doc in enumerate(docs):
+        text = _clean(doc.page_content)
+        if not text or any(text in b.text for b in blocks):
+            continue
+        block = _Block(rank, doc, text)
+        for contained in [b for b in blocks if b.text in text]:
+            block.join(contained, text)
+            blocks.remove(contained)
+        blocks.append(block)
+
+    merged: List[_Block] = []
+    for b in sorted(blocks, key=_Block.position):
+        text = _continuation(merged[-1], b) if merged else None
+        if text is None:
+            merged.append(b)
+        else:
+            merged[-1].join(b, text)
+    blocks = sorted(merged, key=lambda b: b.rank)
+
+    out, used = [], 0
+    for b in blocks:
+        cost = count_tokens(b.text, model) + HEADER_TOKENS
+        text = b.text
+        if used + cost > budget:
+            if out:
+                continue                  # a smaller, less relevant block may still fit
+            text = _truncate(b.text, budget - HEADER_TOKENS, model)   # never return nothing
+            cost = budget
+        meta = dict(b.doc.metadata, merged=b.members)
+        out.append(Document(page_content=text, metadata=meta))
+        used += cost
+    print(f"[context_packer] {len(docs)} chunks -> {len(blocks)} blocks -> {len(out)} packed, "
+          f"~{used}/{budget} tokens")
+    return out
@@ -0,0 +1,274 @@
+# src/embed_executor.py
+"""
+Concurrent, rate-limit-adaptive embedding client (the `inner` of CachedEmbeddings).
+
+OpenAIEmbeddings sends one fixed-size batch after another. For bulk
+re-indexing that leaves most of the account's rate limit unused, and a 429
+just means the SDK sleeps and retries the same request.
+
+EmbedExecutor instead:
+  - packs texts into requests by token count (tiktoken), up to
+    MAX_BATCH_TOKENS / MAX_BATCH_INPUTS per request
+  - sends the requests from a thread pool, with the number in flight
+    bounded by an AIMD limiter: +1 slot per window of successful requests,
+    halved on a 429 / 5xx (once per congestion event, not once per failed
+    request), never below 1 or above EMBED_MAX_CONCURRENCY
+  - retries throttled requests after Retry-After (or exponential backoff
+    with jitter), up to OPENAI_MAX_RETRIES times; each request gets
+    OPENAI_TIMEOUT_SECONDS like every other OpenAI call (src/openai_client.py)
+
+`python -m src.embed_executor` runs it against a local stub server that
+injects latency and 429s and prints throughput and how the limit adapted.
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import openai
+from langchain_core.embeddings import Embeddings
+
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "8"))
+EMBED_INITIAL_CONCURRENCY = 2
+MAX_BATCH_TOKENS = 8192          # tokens per request (API limit is far higher; smaller = more parallelism)
+MAX_BATCH_INPUTS = 256           # texts per request (API limit 2048)
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+
+_RETRYABLE = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+# ---------- token counting ----------
+_ENCODINGS = {}
+
+def _encoding(model: str):
+    if model not in _ENCODINGS:
+        try:
+            import tiktoken
+            try:
+                enc = tiktoken.encoding_for_model(model)
+            except KeyError:
+                enc = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # tiktoken downloads its BPE table on first use; offline we estimate instead
+            print(f"[embed_executor][WARN] tiktoken unavailable ({type(e).__name__}), estimating tokens")
+            enc = None
+        _ENCODINGS[model] = enc
+    return _ENCODINGS[model]
+
+def count_tokens(text: str, model: str) -> int:
+    enc = _encoding(model)
+    if enc is None:
+        return len(text) // 4 + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+def token_batches(texts: List[str], model: str,
+                  max_tokens: int = MAX_BATCH_TOKENS, max_inputs: int = MAX_BATCH_INPUTS) -> List[List[int]]:
+    """Group text indices into requests of at most max_tokens / max_inputs (an oversized text goes alone)."""
+    batches, cur, cur_tokens = [], [], 0
+    for i, t in enumerate(texts):
+        n = count_tokens(t, model)
+        if cur and (cur_tokens + n > max_tokens or len(cur) >= max_inputs):
+            batches.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(i)
+        cur_tokens += n
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+# ---------- AIMD concurrency limiter ----------
+class AdaptiveLimiter:
+    def __init__(self, initial: int = EMBED_INITIAL_CONCURRENCY, maximum: int = EMBED_MAX_CONCURRENCY):
+        self.maximum = max(1, maximum)
+        self.limit = float(min(max(1, initial), self.maximum))
+        self.in_flight = 0
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> float:
+        """Block until a slot is free; returns the start time to pass back to release()."""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                # requests already in flight when we backed off don't count again
+                if started >= self._last_decrease:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = time.monotonic()
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+def _retry_after(err: Exception, attempt: int) -> float:
+    response = getattr(err, "response", None)
+    header = response.headers.get("retry-after") if response is not None else None
+    try:
+        if header is not None:
+            return min(BACKOFF_MAX_SECONDS, float(header))
+    except ValueError:
+        pass
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+# ---------- executor ----------
+class EmbedExecutor(Embeddings):
+    def __init__(
+        self,
+        model: str,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_concurrency: int = EMBED_MAX_CONCURRENCY,
+        initial_concurrency: int = EMBED_INITIAL_CONCURRENCY,
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+    ):
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self._api_key = api_key
+        self._base_url = base_url
+        from src.openai_client import OPENAI_MAX_RETRIES, get_client
+        self.max_retries = OPENAI_MAX_RETRIES
+        if base_url is None:
+            # the API itself: share the process-wide connection pool and timeouts (src/openai_client.py)
+            client = get_client().with_options(api_key=api_key) if api_key else get_client()
+        else:
+            client = get_client().with_options(api_key=api_key, base_url=base_url)
+        # SDK retries off: 429s must reach the limiter instead of being slept on silently
+        self.client = client.with_options(max_retries=0)
+        self.limiter = AdaptiveLimiter(initial_concurrency, max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="embed")
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            started = self.limiter.acquire()
+            try:
+                resp = self.client.embeddings.create(model=self.model, input=texts, encoding_format="float")
+            except _RETRYABLE as e:
+                self.limiter.release(started, throttled=True)
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(_retry_after(e, attempt))
+                continue
+            except Exception:
+                self.limiter.release(started)
+                raise
+            self.limiter.release(started)
+            return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+        raise RuntimeError("unreachable")
+
+    def close(self):
+        """Stop the request thread pool (in-flight requests finish)."""
+        self._pool.shutdown(wait=True)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = token_batches(texts, self.model, self.max_batch_tokens)
+        futures = [self._pool.submit(self._request, [texts[i] for i in b]) for b in batches]
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        for b, f in zip(batches, futures):
+            for i, vec in zip(b, f.result()):
+                out[i] = vec
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._request([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """One query on the event loop (AsyncOpenAI, SDK retries); bulk embedding stays on the thread pool."""
+        if self._base_url is not None:
+            return await super().aembed_query(text)
+        from src.openai_client import get_async_client
+        client = get_async_client().with_options(api_key=self._api_key) if self._api_key else get_async_client()
+        resp = await client.embeddings.create(model=self.model, input=[text], encoding_format="float")
+        return resp.data[0].embedding
+
+
+# ---------- local stub server (python -m src.embed_executor) ----------
+def _serve_stub(latency: float = 0.05, capacity: int = 4, error_rate: float = 0.05, dim: int = 8):
+    """OpenAI-compatible /embeddings endpoint: 429 past `capacity` concurrent requests or at random."""
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    state = {"active": 0, "requests": 0, "rejected": 0, "peak": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, body: dict, headers: Optional[dict] = None):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                state["requests"] += 1
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+                over = state["active"] > capacity or random.random() < error_rate
+                if over:
+                    state["rejected"] += 1
+            try:
+                if over:
+                    self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                               {"retry-after": "0.1"})
+                    return
+                time.sleep(latency * (0.5 + random.random()))
+                inputs = payload["input"]
+                self._send(200, {
+                    "object": "list",
+                    "model": payload["model"],
+                    "data": [{"object": "embedding", "index": i,
+                              "embedding": [float((len(t) + j) % 7) for j in range(dim)]}
+                             for i, t in enumerate(inputs)],
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                })
+            finally:
+                with lock:
+                    state["active"] -= 1
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("OPENAI_API_KEY", "stub")     # src.config needs one; the stub never checks it
+    server, state = _serve_stub()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    texts = [f"clause {i} " + "tenant landlord deposit " * (i % 40) for i in range(3000)]
+
+    ex = EmbedExecutor("text-embedding-3-small", api_key="stub", base_url=url, max_batch_tokens=2048)
+    t0 = time.time()
+    vecs = ex.embed_documents(texts)
+    dt = time.time() - t0
+
+    assert len(vecs) == len(texts) and all(v is not None for v in vecs)
+    assert vecs[5] == [float((len(texts[5]) + j) % 7) for j in range(8)], "results out of order"
+    print(f"{len(texts)} texts in {state['requests'] - state['rejected']} requests, {dt:.2f}s "
+          f"({len(texts) / dt:.0f} texts/s)")
+    print(f"429s: {state['rejected']}, server peak concurrency: {state['peak']}, "
+          f"final limit: {ex.limiter.limit:.2f} (max {ex.limiter.maximum})")
+    server.shutdown()
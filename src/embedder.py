@@ -6,39 +6,16 @@ import sys
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
-from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
-from src.loader import load_and_chunk_pdf
-from src.config import OPENAI_API_KEY, EMBEDDING_MODEL
-
-VECTOR_STORE_DIR = "./vector_store"
-
-def build_vector_store(pdf_path: str):
-    """加载 PDF → 切 chunks → 生成 embedding → 持久化到 Chroma"""
-    print("  Loading and chunking PDF...")
-    chunks = load_and_chunk_pdf(pdf_path)
-
-    print(f" Total chunks: {len(chunks)}")
-    embeddings = OpenAIEmbeddings(
-        openai_api_key=OPENAI_API_KEY,
-        model=EMBEDDING_MODEL
-    )
-
-    print(" Generating embeddings and creating Chroma vector store...")
-    print("   Using COSINE distance metric...")
-    
-    # 明确指定使用 cosine 距离
-    vector_store = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=VECTOR_STORE_DIR,
-        collection_metadata={"hnsw:space": "cosine"}  # 关键修改：使用cosine
-    )
-
-    print(" Persisting vector store...")
-    vector_store.persist()
-    print(f" Vector store created successfully at: {VECTOR_STORE_DIR}")
+from src.retriever import VECTOR_STORE_BASE_DIR, ensure_store, index_config
+
+def build_vector_store(pdf_path: str) -> str:
+    """加载 PDF → 切 chunks → 生成 embedding → 持久化（与 retriever 查询用的是同一个 store）"""
+    # store 目录 = 内容签名 + 配置指纹：同一配置已建过就直接复用，不同配置各自一份
+    print(f" Index config: {index_config()}")
+    persist_dir = ensure_store(pdf_path)
+    print(f" Vector store ready at: {persist_dir}")
     print(f"   Distance metric: COSINE (0-2 range, lower is better)")
+    return persist_dir
 
 
 if __name__ == "__main__":
@@ -53,7 +30,7 @@ if __name__ == "__main__":
     
     print(f"Starting vector store generation...")
     print(f"PDF path: {pdf_path}")
-    print(f"Output directory: {VECTOR_STORE_DIR}")
+    print(f"Output directory: {VECTOR_STORE_BASE_DIR}/<signature>-<config>")
     print("="*60)
     
     build_vector_store(pdf_path)
\ No newline at end of file
@@ -0,0 +1,359 @@
+# src/embedding_cache.py
+"""
+Embedding caches in front of the OpenAI embeddings client (src/embed_executor.py).
+
+Queries — two tiers:
+  1. in-process LRU (dict lookups, no I/O)
+  2. on-disk SQLite in WAL mode, shared by every worker process and by the
+     eval scripts that replay the same question lists
+  Keys are (EMBEDDING_MODEL, normalized query text). Normalization only
+  touches unicode form and whitespace — case and punctuation change the
+  vector, so they are kept.
+
+Chunks — content-addressed: each chunk vector is stored under
+hash(model, chunk text), so rebuilding a store (re-upload of an edited
+contract, chunk-parameter sweeps) only embeds text never seen before.
+
+The database lives outside ./vector_store so wiping stores keeps it. It
+is pruned at most every PRUNE_INTERVAL_SECONDS: query vectors older than
+QUERY_EMBEDDING_TTL_DAYS go, then the least recently used rows of either
+kind until the vectors fit EMBEDDING_CACHE_MAX_MB. Chunk rows count as used
+when a build reads them or a NumPy store that rescores from them is opened.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from src.config import EMBEDDING_MODEL
+from src.embed_executor import EmbedExecutor
+
+CACHE_DB_PATH = "./embedding_cache/embeddings.sqlite3"
+MEMORY_CACHE_MAX_ENTRIES = 4096
+SQL_BATCH = 500            # keys per SELECT ... IN (...)
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+QUERY_EMBEDDING_TTL_DAYS = float(os.getenv("QUERY_EMBEDDING_TTL_DAYS", "30"))
+PRUNE_INTERVAL_SECONDS = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_embeddings (
+    key      TEXT PRIMARY KEY,
+    model    TEXT NOT NULL,
+    query    TEXT NOT NULL,
+    vec      BLOB NOT NULL,
+    created  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    key      TEXT PRIMARY KEY,
+    model    TEXT NOT NULL,
+    vec      BLOB NOT NULL,
+    created  REAL NOT NULL
+);
+"""
+
+
+# ---------- helpers ----------
+def normalize_query(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+def _key(model: str, text: str) -> str:
+    return hashlib.sha1(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+def _pack(vec: List[float]) -> bytes:
+    return array("f", vec).tobytes()
+
+def _unpack_array(blob: bytes) -> array:
+    a = array("f")
+    a.frombytes(blob)
+    return a
+
+def _unpack(blob: bytes) -> List[float]:
+    return _unpack_array(blob).tolist()
+
+
+# ---------- disk tier ----------
+class _DiskCache:
+    """Thin SQLite wrapper; one connection per thread, WAL for multi-process use."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._last_prune = 0.0
+        self._prune_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[List[float]]:
+        try:
+            row = self._conn().execute(
+                "SELECT vec FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[embedding_cache][WARN] read failed: {e}")
+            return None
+        return _unpack(row[0]) if row else None
+
+    def put(self, key: str, model: str, query: str, vec: List[float]):
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?, ?)",
+                    (key, model, query, _pack(vec), time.time()),
+                )
+        except sqlite3.Error as e:
+            print(f"[embedding_cache][WARN] write failed: {e}")
+
+    def get_chunks(self, keys: List[str], raw: bool = False) -> Dict[str, List[float]]:
+        # raw=True returns array('f') buffers (no per-float Python objects)
+        unpack = _unpack_array if raw else _unpack
+        found = {}
+        try:
+            conn = self._conn()
+            for i in range(0, len(keys), SQL_BATCH):
+                part = keys[i:i + SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                rows = conn.execute(
+                    f"SELECT key, vec FROM chunk_embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                found.update((k, unpack(v)) for k, v in rows)
+        except sqlite3.Error as e:
+            print(f"[embedding_cache][WARN] read failed: {e}")
+        return found
+
+    def put_chunks(self, model: str, items: Iterable):
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_embeddings VALUES (?, ?, ?, ?)",
+                    [(k, model, _pack(v), now) for k, v in items],
+                )
+        except sqlite3.Error as e:
+            print(f"[embedding_cache][WARN] write failed: {e}")
+
+    def touch_chunks(self, keys: List[str]):
+        """Mark chunk rows as used now, so pruning keeps them."""
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                for i in range(0, len(keys), SQL_BATCH):
+                    part = keys[i:i + SQL_BATCH]
+                    marks = ",".join("?" * len(part))
+                    conn.execute(f"UPDATE chunk_embeddings SET created = ? WHERE key IN ({marks})", [now, *part])
+        except sqlite3.Error as e:
+            print(f"[embedding_cache][WARN] write failed: {e}")
+
+    def maybe_prune(self):
+        """Prune if the last prune in this process was over PRUNE_INTERVAL_SECONDS ago."""
+        with self._prune_lock:
+            if time.time() - self._last_prune < PRUNE_INTERVAL_SECONDS:
+                return
+            self._last_prune = time.time()
+        try:
+            self.prune()
+        except sqlite3.Error as e:
+            print(f"[embedding_cache][WARN] prune failed: {e}")
+
+    def prune(self, max_bytes: int = EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+              query_ttl: float = QUERY_EMBEDDING_TTL_DAYS * 86400) -> int:
+        """Drop expired query rows, then least recently used rows over max_bytes. Returns rows removed."""
+        conn = self._conn()
+        with conn:
+            removed = conn.execute("DELETE FROM query_embeddings WHERE created < ?",
+                                   (time.time() - query_ttl,)).rowcount
+            total = sum(conn.execute(f"SELECT COALESCE(SUM(length(vec)), 0) FROM {t}").fetchone()[0]
+                        for t in ("query_embeddings", "chunk_embeddings"))
+            excess = total - max_bytes
+            if excess > 0:
+                victims = {"query_embeddings": [], "chunk_embeddings": []}
+                rows = conn.execute(
+                    "SELECT 'query_embeddings', key, length(vec), created FROM query_embeddings "
+                    "UNION ALL SELECT 'chunk_embeddings', key, length(vec), created FROM chunk_embeddings "
+                    "ORDER BY created"
+                )
+                for table, key, size, _ in rows:
+                    if excess <= 0:
+                        break
+                    victims[table].append(key)
+                    excess -= size
+                for table, keys in victims.items():
+                    for i in range(0, len(keys), SQL_BATCH):
+                        part = keys[i:i + SQL_BATCH]
+                        conn.execute(f"DELETE FROM {table} WHERE key IN ({','.join('?' * len(part))})", part)
+                        removed += len(part)
+        if removed:
+            # freed pages are reused by later writes, so the file stops growing past the budget
+            print(f"[embedding_cache] Pruned {removed} cached vectors")
+        return removed
+
+
+# ---------- public ----------
+class CachedEmbeddings(Embeddings):
+    """
+    Drop-in Embeddings wrapper: embed_query() is served from the cache when
+    possible, so Chroma's similarity_search_* never hits the network for a
+    question it has seen before.
+    """
+
+    def __init__(self, inner: Embeddings, model: str, db_path: str = CACHE_DB_PATH):
+        self.inner = inner
+        self.model = model
+        self._disk = _DiskCache(db_path)
+        self._mem: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _mem_get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vec = self._mem.get(key)
+            if vec is not None:
+                self._mem.move_to_end(key)
+            return vec
+
+    def _mem_put(self, key: str, vec: List[float]):
+        with self._lock:
+            self._mem[key] = vec
+            self._mem.move_to_end(key)
+            while len(self._mem) > MEMORY_CACHE_MAX_ENTRIES:
+                self._mem.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        norm = normalize_query(text)
+        key = _key(self.model, norm)
+
+        vec = self._mem_get(key)
+        if vec is not None:
+            return vec
+
+        vec = self._disk.get(key)
+        if vec is None:
+            vec = self.inner.embed_query(norm)
+            self._disk.put(key, self.model, norm, vec)
+            self._disk.maybe_prune()
+        self._mem_put(key, vec)
+        return vec
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async embed_query: cache hits return at once, a miss awaits the inner client's aembed_query."""
+        vec = self.peek_query(text)          # memory / local SQLite: no network wait
+        if vec is not None:
+            return vec
+        norm = normalize_query(text)
+        key = _key(self.model, norm)
+        vec = await self.inner.aembed_query(norm)
+        self._disk.put(key, self.model, norm, vec)
+        self._disk.maybe_prune()
+        self._mem_put(key, vec)
+        return vec
+
+    def peek_query(self, text: str) -> Optional[List[float]]:
+        """Cached vector for a query, or None — never calls the API."""
+        key = _key(self.model, normalize_query(text))
+        vec = self._mem_get(key)
+        if vec is None:
+            vec = self._disk.get(key)
+            if vec is not None:
+                self._mem_put(key, vec)
+        return vec
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Batch version of embed_query: all cache misses go out in ONE API request."""
+        norms = [normalize_query(t) for t in texts]
+        keys = [_key(self.model, n) for n in norms]
+
+        found = {}
+        missing = {}
+        for k, n in zip(keys, norms):
+            if k in found or k in missing:
+                continue
+            vec = self._mem_get(k)
+            if vec is None:
+                vec = self._disk.get(k)
+            if vec is None:
+                missing[k] = n
+            else:
+                found[k] = vec
+
+        if missing:
+            vecs = self.inner.embed_documents(list(missing.values()))
+            for (k, n), vec in zip(missing.items(), vecs):
+                self._disk.put(k, self.model, n, vec)
+                found[k] = vec
+            self._disk.maybe_prune()
+        for k, vec in found.items():
+            self._mem_put(k, vec)
+        return [found[k] for k in keys]
+
+    def cached_documents(self, texts: List[str]) -> List[Optional[array]]:
+        """Stored chunk vectors as array('f') (None where missing) — never calls the API."""
+        keys = [_key(self.model, t) for t in texts]
+        found = self._disk.get_chunks(list(set(keys)), raw=True)
+        return [found.get(k) for k in keys]
+
+    def touch_documents(self, texts: List[str]):
+        """Keep these chunks' vectors through pruning (a store that rescores from them was opened)."""
+        self._disk.touch_chunks(list({_key(self.model, t) for t in texts}))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [_key(self.model, t) for t in texts]
+        found = self._disk.get_chunks(list(set(keys)))
+        self._disk.touch_chunks(list(found))
+
+        # embed each unseen text once, even if it repeats within the batch
+        missing = {}
+        for k, t in zip(keys, texts):
+            if k not in found and k not in missing:
+                missing[k] = t
+        if missing:
+            vecs = self.inner.embed_documents(list(missing.values()))
+            new = dict(zip(missing.keys(), vecs))
+            self._disk.put_chunks(self.model, new.items())
+            found.update(new)
+            self._disk.maybe_prune()
+
+        print(f"[embedding_cache] Chunks: {len(texts)} total, "
+              f"{len(texts) - len(missing)} cached, {len(missing)} embedded")
+        return [found[k] for k in keys]
+
+
+_EMBEDDINGS = None
+
+def get_embeddings() -> CachedEmbeddings:
+    """Process-wide cached embeddings client shared by retriever and embedder."""
+    global _EMBEDDINGS
+    if _EMBEDDINGS is None:
+        _EMBEDDINGS = CachedEmbeddings(
+            EmbedExecutor(EMBEDDING_MODEL),
+            model=EMBEDDING_MODEL,
+        )
+    return _EMBEDDINGS
+
+def shutdown():
+    """Release the shared client's thread pool (before src.* is dropped from sys.modules)."""
+    global _EMBEDDINGS
+    if _EMBEDDINGS is not None:
+        close = getattr(_EMBEDDINGS.inner, "close", None)
+        if close is not None:
+            close()
+        _EMBEDDINGS = None
@@ -0,0 +1,174 @@
+# src/faq_answers.py
+"""
+Precomputed answers for the sidebar FAQ (FAQ_DATA.FAQ_ITEMS).
+
+The FAQ questions are fixed, so once a contract's store is built every FAQ
+answer is generated in the background (FAQ_WORKERS questions at a time,
+through the same chat.answer path as a live question) and saved beside the
+store as faq_answers.json. The file records the store key and the answer
+settings it was made with (chat.answer_config: threshold, prompts, model,
+retrieval and packing settings), so neither an incremental rebuild that
+copies the previous store directory nor a tuning change serves stale
+answers. Evaluation and tuning scripts call chat.answer, which skips this.
+
+lookup() serves sidebar clicks (exact question text) and free-text
+questions whose embedding is within FAQ_MATCH_SIMILARITY of an FAQ
+question, with no retrieval or GPT call. Like the answer cache, it embeds
+a query only when retrieval would embed it anyway (answer_cache.query_vector).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src import retriever
+from src.answer_cache import ANSWER_CACHE_SIMILARITY, cache_text, query_vector
+from src.embedding_cache import get_embeddings
+
+FAQ_FILE = "faq_answers.json"
+FAQ_WORKERS = 4                          # FAQ answers generated concurrently
+FAQ_MATCH_SIMILARITY = ANSWER_CACHE_SIMILARITY
+FAQ_RECHECK_SECONDS = 30                 # how often a store without answers is re-checked on disk
+
+try:
+    from FAQ_DATA import FAQ_ITEMS
+except ImportError:
+    FAQ_ITEMS = {}
+
+
+def faq_questions() -> List[str]:
+    return list(dict.fromkeys(q for questions in FAQ_ITEMS.values() for q in questions))
+
+
+class _FaqSet:
+    def __init__(self, answers: Dict[str, dict]):
+        self.answers = answers                                   # question -> response
+        self.by_text = {cache_text(q): q for q in answers}
+        self.questions = list(answers)
+        self._matrix: Optional[np.ndarray] = None
+
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            vecs = np.asarray(get_embeddings().embed_queries(self.questions), dtype=np.float32)
+            norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self._matrix = vecs / norms
+        return self._matrix
+
+
+_Key = Tuple[str, str]                          # (store key, answer settings fingerprint)
+_SETS: Dict[_Key, Optional[_FaqSet]] = {}       # -> answers (None: none on disk yet)
+_CHECKED: Dict[_Key, float] = {}
+_LOCK = threading.Lock()
+
+
+def _key(pdf_path: str) -> _Key:
+    from src.chat import answer_config     # chat serves lookups from this module
+    config = json.dumps(answer_config(), sort_keys=True, ensure_ascii=False)
+    return retriever.store_key(pdf_path), hashlib.sha256(config.encode("utf-8")).hexdigest()[:16]
+
+
+def _path(key: _Key) -> str:
+    return os.path.join(retriever._persist_dir_name(key[0]), FAQ_FILE)
+
+
+def _read(key: _Key) -> Dict[str, dict]:
+    try:
+        with open(_path(key), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("store_key") != key[0] or data.get("answer_config") != key[1]:
+        return {}
+    return data.get("answers", {})
+
+
+def _get_set(key: _Key) -> Optional[_FaqSet]:
+    with _LOCK:
+        if key in _SETS and (_SETS[key] is not None or time.time() - _CHECKED.get(key, 0) < FAQ_RECHECK_SECONDS):
+            return _SETS[key]
+    answers = _read(key)
+    faq_set = _FaqSet(answers) if answers else None
+    with _LOCK:
+        _SETS[key] = faq_set
+        _CHECKED[key] = time.time()
+    return faq_set
+
+
+def lookup(query: str, pdf_path: str) -> Optional[dict]:
+    """Precomputed answer if the query is (or closely matches) an FAQ question, else None."""
+    t0 = time.perf_counter()
+    faq_set = _get_set(_key(pdf_path))
+    if faq_set is None:
+        return None
+    question = faq_set.by_text.get(cache_text(query))
+    how = "exact"
+    if question is None:
+        vec = query_vector(query, pdf_path)
+        if vec is None:
+            return None
+        q = np.asarray(vec, dtype=np.float32)
+        sims = faq_set.matrix() @ (q / (np.linalg.norm(q) or 1.0))
+        best = int(np.argmax(sims))
+        if sims[best] < FAQ_MATCH_SIMILARITY:
+            return None
+        question, how = faq_set.questions[best], f"similarity {sims[best]:.3f}"
+    print(f"[faq] Precomputed answer ({how}): {question!r} in {(time.perf_counter() - t0) * 1e3:.1f}ms")
+    return dict(faq_set.answers[question], cached=True, faq=True)
+
+
+def is_complete(pdf_path: str) -> bool:
+    """True if every FAQ question already has a stored answer for this contract."""
+    faq_set = _get_set(_key(pdf_path))
+    return faq_set is not None and all(q in faq_set.answers for q in faq_questions())
+
+
+def precompute(pdf_path: str, progress=lambda done, total: None) -> int:
+    """
+    Answer every FAQ question missing for this contract and save them beside
+    its store (call once the store is built). Returns how many were saved;
+    failed answers are left out and retried on the next call.
+    """
+    from src.chat import answer     # chat serves lookups from this module
+
+    key = _key(pdf_path)
+    answers = _read(key)
+    todo = [q for q in faq_questions() if q not in answers]
+    if not todo:
+        return 0
+
+    def generate(question: str) -> dict:
+        try:
+            return answer(question, pdf_path)
+        except Exception as e:
+            return {"error": str(e)}
+
+    print(f"[faq] Generating {len(todo)} FAQ answers for {pdf_path}")
+    t0 = time.time()
+    get_embeddings().embed_queries(todo)         # one embedding request for all questions
+    done = saved = 0
+    with ThreadPoolExecutor(max_workers=FAQ_WORKERS, thread_name_prefix="faq") as pool:
+        for question, response in zip(todo, pool.map(generate, todo)):
+            done += 1
+            progress(done, len(todo))
+            if "error" in response:
+                print(f"[faq][WARN] No answer for {question!r}: {response['error']}")
+                continue
+            answers[question] = response
+            saved += 1
+
+    path = _path(key)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"store_key": key[0], "answer_config": key[1], "answers": answers}, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+    with _LOCK:
+        _SETS[key] = _FaqSet(answers) if answers else None
+        _CHECKED[key] = time.time()
+    print(f"[faq] {len(answers)} FAQ answers ready ({time.time() - t0:.1f}s)")
+    return saved
@@ -0,0 +1,111 @@
+# src/ingest.py
+"""
+Background index builds for uploaded contracts.
+
+app.py starts a build as soon as a PDF is uploaded; the Streamlit script
+keeps running and shows the job's progress in the sidebar. Until the dense
+index is ready, retriever.search answers from the lexical index over the
+already-extracted text (see retriever._lexical_while_building), so the
+first answer doesn't wait for embedding throughput.
+
+Once the store is built the job also precomputes the sidebar FAQ answers
+for the contract (see src/faq_answers.py) before it reports ready.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from src import faq_answers, retriever
+
+MAX_CONCURRENT_BUILDS = 2
+
+STAGE_LABELS = {
+    "queued": "Queued",
+    "extracting": "Reading PDF",
+    "embedding": "Building search index",
+    "faq": "Preparing quick answers",
+    "ready": "Ready",
+    "failed": "Failed",
+}
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BUILDS, thread_name_prefix="ingest")
+_JOBS: Dict[str, "IndexJob"] = {}      # store key -> job
+_LOCK = threading.Lock()
+
+
+class IndexJob:
+    def __init__(self, pdf_path: str, key: str):
+        self.pdf_path = pdf_path
+        self.key = key
+        self.stage = "queued"
+        self.progress = 0.0
+        self.error: Optional[str] = None
+        self.started = time.time()
+        self.finished: Optional[float] = None
+
+    def update(self, stage: str, progress: float):
+        self.stage = stage
+        self.progress = max(self.progress, progress)
+
+    @property
+    def done(self) -> bool:
+        return self.stage in ("ready", "failed")
+
+    @property
+    def label(self) -> str:
+        return STAGE_LABELS.get(self.stage, self.stage)
+
+
+def _run(job: IndexJob):
+    def store_progress(stage: str, fraction: float):
+        # the store build reports 0..1 of its own; keep the last 10% for the FAQ answers
+        if stage != "ready":
+            job.update(stage, 0.9 * fraction)
+
+    try:
+        retriever.ensure_store(job.pdf_path, progress=store_progress)
+        job.update("faq", 0.9)
+        try:
+            faq_answers.precompute(job.pdf_path, progress=lambda done, total: job.update("faq", 0.9 + 0.1 * done / total))
+        except Exception as e:
+            # the contract is searchable; FAQ clicks just go through chat.ask as usual
+            print(f"[ingest][WARN] FAQ answers not precomputed for {job.pdf_path}: {e}")
+        job.update("ready", 1.0)
+        print(f"[ingest] Index ready for {job.pdf_path} ({time.time() - job.started:.1f}s)")
+    except Exception as e:
+        job.stage = "failed"
+        job.error = str(e)
+        print(f"[ingest] ❌ Index build failed for {job.pdf_path}: {e}")
+    finally:
+        job.finished = time.time()
+
+
+def start_index_build(pdf_path: str, retry: bool = False) -> IndexJob:
+    """
+    Start (or join) the background build for this PDF's current content and
+    index config. A failed build is returned as is, error and all, so a
+    rerun doesn't resubmit it; pass retry=True (the user asked) to start over.
+    """
+    key = retriever.store_key(pdf_path)
+    with _LOCK:
+        job = _JOBS.get(key)
+        if job is not None and (job.stage != "failed" or not retry):
+            return job
+        job = IndexJob(pdf_path, key)
+        _JOBS[key] = job
+    if retriever.is_store_ready(pdf_path) and faq_answers.is_complete(pdf_path):
+        job.update("ready", 1.0)
+        job.finished = time.time()
+        return job
+    print(f"[ingest] Background index build started: {pdf_path}")
+    retriever.announce_build(pdf_path)      # before the job runs: queries must not build it themselves
+    _EXECUTOR.submit(_run, job)
+    return job
+
+
+def get_job(pdf_path: str) -> Optional[IndexJob]:
+    """The build job for this PDF's current content, if one was started."""
+    with _LOCK:
+        return _JOBS.get(retriever.store_key(pdf_path))
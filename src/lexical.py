@@ -0,0 +1,190 @@
+# src/lexical.py
+"""
+BM25 lexical index stored beside each vector store.
+
+Tenants often type the contract's own vocabulary ("diplomatic clause",
+"security deposit", "aircon servicing"). For those questions an exact
+keyword match is as good as a dense match and needs no embedding call.
+
+Besides the BM25 score, every hit reports `coverage`: the share of the
+query's IDF mass found in the chunk (1.0 = every query term present).
+Coverage is what decides the fast path and what maps a lexical hit onto
+the cosine-distance scale used by THRESHOLD_CAN_ANSWER.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import List, NamedTuple, Optional
+
+from langchain_core.documents import Document
+
+LEXICAL_FILE = "lexical.json"
+
+K1 = 1.5
+B = 0.75
+
+# Fast path: the top chunk must contain every query term and clearly beat
+# the runner-up, and the query must have enough content words to be specific.
+DECISIVE_MIN_TERMS = 2
+DECISIVE_MIN_COVERAGE = 1.0
+DECISIVE_MARGIN = 1.5            # top BM25 >= margin * second BM25
+
+# coverage 1.0 maps to this distance; coverage 0 maps to 1.0. Calibrated on
+# the test_classification.py questions: the ones with a decisive match got
+# dense distances 0.556 / 0.637 / 0.679 (mean ~0.62), all labelled answerable,
+# and no unanswerable question is decisive. The retriever only takes the fast
+# path while this stays below THRESHOLD_CAN_ANSWER; test_classification.py
+# lists the fast-path questions so the pair can be re-checked after tuning.
+BEST_LEXICAL_DISTANCE = 0.62
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "if", "of", "to", "in", "on", "at", "by",
+    "for", "with", "from", "as", "is", "are", "was", "were", "be", "been", "being",
+    "do", "does", "did", "can", "could", "will", "would", "shall", "should", "may",
+    "might", "must", "i", "me", "my", "we", "our", "you", "your", "he", "she", "it",
+    "its", "they", "them", "their", "this", "that", "these", "those", "what", "whats",
+    "which", "who", "whom", "when", "where", "why", "how", "there", "here", "any",
+    "all", "some", "no", "not", "so", "than", "too", "very", "have", "has", "had",
+    "about", "into", "up", "out", "s", "t",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for tok in _TOKEN_RE.findall((text or "").lower()):
+        if tok in STOPWORDS:
+            continue
+        # light plural folding: "clauses" -> "clause", "fees" -> "fee"
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        tokens.append(tok)
+    return tokens
+
+
+def lexical_distance(coverage: float) -> float:
+    """Map coverage in [0, 1] onto the cosine-distance scale (lower is better)."""
+    return 1.0 - coverage * (1.0 - BEST_LEXICAL_DISTANCE)
+
+
+class LexicalHit(NamedTuple):
+    index: int
+    doc: Document
+    bm25: float
+    coverage: float
+
+
+class LexicalIndex:
+    """
+    Grows a batch at a time: add() tokenizes only the new chunks and updates
+    the document frequencies, and the IDF table is rebuilt lazily on the next
+    search, so ingestion can feed it per page and it is searchable as soon as
+    extraction ends. It keeps every chunk's text and term counts, so its
+    memory grows with the document.
+    """
+
+    def __init__(self, chunks: Optional[List[dict]] = None):
+        self.chunks: List[dict] = []    # [{"text": ..., "metadata": {...}}, ...]
+        self.tfs: List[Counter] = []
+        self.lengths: List[int] = []
+        self.df: Counter = Counter()
+        self._idf: Optional[dict] = None
+        self._add_chunks(chunks or [])
+
+    def _add_chunks(self, chunks: List[dict]):
+        for c in chunks:
+            tf = Counter(tokenize(c["text"]))
+            self.chunks.append(c)
+            self.tfs.append(tf)
+            self.lengths.append(sum(tf.values()))
+            self.df.update(tf.keys())
+        self._idf = None
+
+    def add(self, docs: List[Document]):
+        self._add_chunks([{"text": d.page_content, "metadata": dict(d.metadata)} for d in docs])
+
+    @property
+    def avgdl(self) -> float:
+        return (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    @property
+    def idf(self) -> dict:
+        if self._idf is None:
+            n = len(self.chunks)
+            self._idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in self.df.items()}
+        return self._idf
+
+    @property
+    def max_idf(self) -> float:
+        # terms never seen in the contract weigh as much as the rarest term
+        n = len(self.chunks)
+        return math.log(1 + (n + 0.5) / 0.5)
+
+    # ---------- build / load ----------
+    @classmethod
+    def build(cls, persist_dir: str, docs: List[Document]) -> "LexicalIndex":
+        index = cls()
+        index.add(docs)
+        index.save(persist_dir)
+        return index
+
+    def save(self, persist_dir: str):
+        os.makedirs(persist_dir, exist_ok=True)
+        with open(os.path.join(persist_dir, LEXICAL_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.chunks, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "LexicalIndex":
+        with open(os.path.join(persist_dir, LEXICAL_FILE), "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, LEXICAL_FILE))
+
+    # ---------- search ----------
+    def search(self, query: str, k: int = 5, topic_filter: Optional[List[str]] = None) -> List[LexicalHit]:
+        """BM25 top k; `topic_filter` restricts it to chunks in those topic partitions."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.chunks:
+            return []
+
+        idf, max_idf, avgdl = self.idf, self.max_idf, self.avgdl
+        weights = {t: idf.get(t, max_idf) for t in terms}
+        total_weight = sum(weights.values())
+
+        scored = []
+        for i, tf in enumerate(self.tfs):
+            if topic_filter is not None and self.chunks[i]["metadata"].get("topic") not in topic_filter:
+                continue
+            bm25 = 0.0
+            matched = 0.0
+            norm = K1 * (1 - B + B * self.lengths[i] / (avgdl or 1.0))
+            for t in terms:
+                f = tf.get(t)
+                if not f:
+                    continue
+                bm25 += idf[t] * f * (K1 + 1) / (f + norm)
+                matched += weights[t]
+            if bm25 > 0:
+                scored.append((bm25, matched / total_weight, i))
+
+        scored.sort(reverse=True)
+        return [
+            LexicalHit(i, Document(page_content=self.chunks[i]["text"],
+                                   metadata=dict(self.chunks[i]["metadata"])), bm25, cov)
+            for bm25, cov, i in scored[:k]
+        ]
+
+    def is_decisive(self, query: str, hits: List[LexicalHit]) -> bool:
+        """True when the keyword match alone is strong enough to answer from."""
+        if not hits or len(set(tokenize(query))) < DECISIVE_MIN_TERMS:
+            return False
+        top = hits[0]
+        if top.coverage < DECISIVE_MIN_COVERAGE:
+            return False
+        return len(hits) == 1 or top.bm25 >= DECISIVE_MARGIN * hits[1].bm25
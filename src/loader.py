@@ -1,21 +1,134 @@
 # src/loader.py
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from src.config import CHUNK_SIZE, CHUNK_OVERLAP
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 
-def load_and_chunk_pdf(pdf_path: str):
-    """读取 PDF 并切成 chunk 列表"""
-    loader = PyPDFLoader(pdf_path)
-    pages = loader.load()
+from pypdf import PdfReader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from src.config import CHUNK_SIZE, CHUNK_OVERLAP, CHUNKER
+
+# 多进程按页段并行提取文本（长合同 80–150 页时单核要好几秒）
+PARALLEL_MIN_PAGES = 16                       # 页数少于这个就单进程，进程开销不划算
+PAGES_PER_TASK = 8                            # 每个子任务处理的连续页数
+EXTRACT_WORKERS = max(1, min(8, (os.cpu_count() or 1) - 1))
+IN_FLIGHT_TASKS = EXTRACT_WORKERS * 2         # 流式提取时最多排队的页段数（背压）
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    # spawn：Streamlit 进程里有线程，fork 不安全；池子常驻，只付一次启动开销
+    # 注意：spawn 的子进程会重新 import 主脚本，直接运行的脚本必须有 if __name__ == "__main__" 保护
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _POOL
+
+def _reset_pool():
+    # 坏掉的进程池（子进程崩溃）丢弃，下次重新创建
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+
+def shutdown_pool():
+    """关闭常驻进程池（重新加载 src.* 之前调用，否则旧模块的池子没人管）"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=True, cancel_futures=True)
+            _POOL = None
+
+def _extract_range(pdf_path: str, numbers: Sequence[int]) -> List[Tuple[int, str]]:
+    """子进程里执行：打开 PDF，提取一段页的文本"""
+    reader = PdfReader(pdf_path)
+    return [(i, reader.pages[i].extract_text() or "") for i in numbers]
+
+def _page_numbers(pdf_path: str, page_numbers: Optional[Iterable[int]]) -> List[int]:
+    if page_numbers is None:
+        return list(range(len(PdfReader(pdf_path).pages)))
+    return sorted(set(page_numbers))
 
-    splitter = RecursiveCharacterTextSplitter(
+def _page_doc(pdf_path: str, i: int, text: str) -> Document:
+    return Document(page_content=text, metadata={"source": pdf_path, "page": i})
+
+def iter_pdf_pages(pdf_path: str, page_numbers: Optional[Iterable[int]] = None) -> Iterator[Document]:
+    """
+    按页码顺序逐页产出 Document（流式，不把整本 PDF 的文本留在内存里）。
+    并行时最多 IN_FLIGHT_TASKS 个页段在进程池里排队：下游消费慢，提取就停下等。
+    """
+    numbers = _page_numbers(pdf_path, page_numbers)
+    done = 0
+    if len(numbers) >= PARALLEL_MIN_PAGES and EXTRACT_WORKERS > 1:
+        ranges = deque(numbers[i:i + PAGES_PER_TASK] for i in range(0, len(numbers), PAGES_PER_TASK))
+        in_flight = deque()
+        try:
+            pool = _get_pool()
+            while ranges or in_flight:
+                while ranges and len(in_flight) < IN_FLIGHT_TASKS:
+                    in_flight.append(pool.submit(_extract_range, pdf_path, ranges.popleft()))
+                for i, text in in_flight.popleft().result():
+                    yield _page_doc(pdf_path, i, text)
+                    done += 1
+            return
+        except Exception as e:
+            print(f"[loader][WARN] 并行提取失败，剩余页改为单进程: {e}")
+            for f in in_flight:
+                f.cancel()
+            _reset_pool()
+
+    reader = PdfReader(pdf_path)
+    for i in numbers[done:]:
+        yield _page_doc(pdf_path, i, reader.pages[i].extract_text() or "")
+
+def load_pdf_pages(pdf_path: str, page_numbers: Optional[Iterable[int]] = None) -> List[Document]:
+    """
+    按页提取文本，metadata 与 PyPDFLoader 一致（page 从 0 开始）。
+    page_numbers 为 None 时提取全部页；否则只提取指定页（增量重建用）。
+    页数多时按页段分给进程池并行提取，结果按页码顺序重新拼好。
+    """
+    return list(iter_pdf_pages(pdf_path, page_numbers))
+
+def count_pdf_pages(pdf_path: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+def chunking_config() -> dict:
+    """决定 chunk 内容的全部参数（retriever 用它给 store 目录加指纹）"""
+    cfg = {"chunker": CHUNKER, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "start_index": True}
+    if CHUNKER == "clause":
+        from src.clause_chunker import CLAUSE_CHUNKER_VERSION, CLAUSE_MAX_TOKENS
+        cfg.update(clause_max_tokens=CLAUSE_MAX_TOKENS, clause_chunker_version=CLAUSE_CHUNKER_VERSION)
+    return cfg
+
+def get_splitter():
+    """
+    retriever / embedder / loader 共用的切分器（由 config.CHUNKER 决定）。
+    ClauseChunker 在相邻页之间保留状态：每份文档新建一个，按页码顺序喂页。
+    """
+    if CHUNKER == "clause":
+        from src.clause_chunker import ClauseChunker
+        return ClauseChunker()
+    return RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
-        separators=["\n\n", "\n", ". ", " ", ""]
+        separators=["\n\n", "\n", ". ", " ", ""],
+        add_start_index=True,           # 页内位置：context_packer 按它合并相邻 chunk
     )
 
-    chunks = splitter.split_documents(pages)
+def load_and_chunk_pdf(pdf_path: str):
+    """读取 PDF 并切成 chunk 列表"""
+    pages = load_pdf_pages(pdf_path)
+    chunks = get_splitter().split_documents(pages)
     return chunks
 
 if __name__ == "__main__":
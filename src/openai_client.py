@@ -0,0 +1,89 @@
+# src/openai_client.py
+"""
+Process-wide OpenAI client shared by chat, chat_multi, rag_chain and the
+embeddings executor.
+
+One client means one httpx connection pool: connections stay alive between
+questions (no TLS handshake per call) and survive Streamlit reruns, since
+the module is imported once per process. Every request gets
+
+  - timeouts: OPENAI_CONNECT_TIMEOUT_SECONDS to connect, and
+    OPENAI_TIMEOUT_SECONDS for each read/write (for a stream, between
+    chunks), so a stalled API fails the question instead of hanging it
+  - bounded retry: up to OPENAI_MAX_RETRIES retries on connection errors,
+    408/409/429 and 5xx, with the SDK's exponential backoff plus jitter
+    (Retry-After is honoured when the API sends it)
+
+Callers that need different settings take a view with
+get_client().with_options(...), which keeps the same connection pool
+(embed_executor turns SDK retries off to run its own rate limiter).
+
+get_async_client() is the AsyncOpenAI counterpart for chat.ask_async, with
+the same timeouts and retries. An async connection pool belongs to the
+event loop that opened it, so there is one async client per running loop.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+import openai
+
+from src.config import OPENAI_API_KEY
+
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+OPENAI_CONNECT_TIMEOUT_SECONDS = 5.0
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+MAX_CONNECTIONS = 32                 # embeddings executor (8) + concurrent chats / FAQ workers
+MAX_KEEPALIVE_CONNECTIONS = 16
+KEEPALIVE_EXPIRY_SECONDS = 60.0
+
+_CLIENT = None
+_LOCK = threading.Lock()
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, openai.AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=OPENAI_CONNECT_TIMEOUT_SECONDS)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def get_client() -> openai.OpenAI:
+    """The shared, pooled OpenAI client (created on first use)."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _LOCK:
+            if _CLIENT is None:
+                _CLIENT = openai.OpenAI(
+                    api_key=OPENAI_API_KEY,
+                    timeout=_timeout(),
+                    max_retries=OPENAI_MAX_RETRIES,
+                    http_client=openai.DefaultHttpxClient(limits=_limits(), timeout=_timeout()),
+                )
+                print(f"[openai_client] Shared client ready (timeout {OPENAI_TIMEOUT_SECONDS:.0f}s, "
+                      f"{OPENAI_MAX_RETRIES} retries, pool {MAX_CONNECTIONS})")
+    return _CLIENT
+
+
+def get_async_client() -> openai.AsyncOpenAI:
+    """The shared AsyncOpenAI client for the running event loop (call from a coroutine)."""
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None:
+        client = openai.AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            timeout=_timeout(),
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=openai.DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout()),
+        )
+        _ASYNC_CLIENTS[loop] = client
+    return client
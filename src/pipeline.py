@@ -0,0 +1,222 @@
+# src/pipeline.py
+"""
+Streaming ingestion: pages -> chunks -> embedding batches -> upserts.
+
+Each stage runs in its own thread and hands work to the next through a small
+bounded queue, so extraction of page N+1 overlaps with embedding page N and
+with writing the previous batch. When a downstream stage falls behind, the
+queue fills up and the upstream stage blocks (backpressure) — at most
+QUEUE_DEPTH batches sit between any two stages, whatever the PDF's size.
+
+That bounds the work in flight, not the whole build: IndexSink (up to
+max_numpy_chunks) and the retriever's lexical index still grow with the
+document.
+
+Sinks decide where embedded batches go:
+  - ChromaSink upserts each batch straight into a Chroma collection
+  - IndexSink buffers encoded rows for the NumPy backend (at most
+    max_numpy_chunks of them) and spills to Chroma once the store outgrows
+    that (the retriever's backend rule), streaming every later batch
+"""
+
+import queue
+import threading
+import uuid
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.loader import count_pdf_pages, iter_pdf_pages
+from src.vector_index import NumpyIndex
+
+EMBED_BATCH_SIZE = 256           # chunks per embed stage call / upsert (split into parallel requests by the executor)
+QUEUE_DEPTH = 2                  # batches buffered between two stages
+
+Splitter = Callable[[List[Document]], List[Document]]
+Progress = Callable[[str, float], None]
+
+_DONE = object()
+
+
+class _Failed:
+    """Carries a stage's exception to the consumer thread."""
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    # blocking put that gives up once the consumer has stopped
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(q: queue.Queue, stop: threading.Event) -> Iterator:
+    while True:
+        try:
+            item = q.get(timeout=0.2)
+        except queue.Empty:
+            if stop.is_set():
+                return
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _Failed):
+            raise item.exc
+        yield item
+
+
+def _start_stage(name: str, produce: Callable[[], Iterator], out: queue.Queue, stop: threading.Event):
+    def run():
+        try:
+            for item in produce():
+                if not _put(out, item, stop):
+                    return
+            _put(out, _DONE, stop)
+        except BaseException as e:
+            _put(out, _Failed(e), stop)
+
+    t = threading.Thread(target=run, name=f"pipeline-{name}", daemon=True)
+    t.start()
+    return t
+
+
+# ---------- sinks ----------
+def _chroma(persist_dir: str, embedding: Embeddings) -> Chroma:
+    return Chroma(
+        persist_directory=persist_dir,
+        embedding_function=embedding,
+        collection_metadata={"hnsw:space": "cosine"},
+    )
+
+
+class ChromaSink:
+    def __init__(self, persist_dir: str, embedding: Embeddings):
+        self.store = _chroma(persist_dir, embedding)
+
+    def add(self, docs: List[Document], vectors: List[List[float]]):
+        self.store._collection.upsert(
+            ids=[str(uuid.uuid4()) for _ in docs],
+            embeddings=[list(map(float, v)) for v in vectors],
+            metadatas=[dict(d.metadata) for d in docs],
+            documents=[d.page_content for d in docs],
+        )
+
+    def finish(self) -> Tuple[Chroma, str]:
+        return self.store, "chroma"
+
+
+class IndexSink:
+    """
+    NumPy backend while the store is small; spills everything to Chroma past
+    max_numpy_chunks. Until then every row and chunk text is buffered here —
+    kept in stored form (truncated and quantized), so the buffer is no bigger
+    than the index it becomes; after the spill batches go straight to Chroma.
+    """
+
+    def __init__(self, persist_dir: str, embedding: Embeddings, max_numpy_chunks: int):
+        self.persist_dir = persist_dir
+        self.embedding = embedding
+        self.max_numpy_chunks = max_numpy_chunks
+        self.chunks: List[dict] = []
+        self.stored: List[np.ndarray] = []
+        self.scales: List[np.ndarray] = []
+        self.full_dims = 0
+        self.chroma: Optional[ChromaSink] = None
+
+    def add(self, docs: List[Document], vectors: List[List[float]]):
+        if self.chroma is None and len(self.chunks) + len(docs) > self.max_numpy_chunks:
+            print(f"[pipeline] More than {self.max_numpy_chunks} chunks, spilling to chroma")
+            self.chroma = ChromaSink(self.persist_dir, self.embedding)
+            # only encoded rows were kept: the full vectors come back from the chunk embedding cache
+            for i in range(0, len(self.chunks), EMBED_BATCH_SIZE):
+                part = self.chunks[i:i + EMBED_BATCH_SIZE]
+                self.chroma.add(
+                    [Document(page_content=c["text"], metadata=c["metadata"]) for c in part],
+                    self.embedding.embed_documents([c["text"] for c in part]),
+                )
+            self.chunks, self.stored, self.scales = [], [], []
+        if self.chroma is not None:
+            self.chroma.add(docs, vectors)
+            return
+        stored, scales = NumpyIndex.encode(vectors)
+        self.chunks.extend({"text": d.page_content, "metadata": dict(d.metadata)} for d in docs)
+        self.stored.append(stored)
+        if scales is not None:
+            self.scales.append(scales)
+        self.full_dims = len(vectors[0]) if len(vectors) else self.full_dims
+
+    def finish(self) -> Tuple[Union[NumpyIndex, Chroma], str]:
+        if self.chroma is not None:
+            return self.chroma.finish()
+        stored = np.concatenate(self.stored) if self.stored else np.zeros((0, 0), dtype=np.float32)
+        scales = np.concatenate(self.scales) if self.scales else None
+        return NumpyIndex.from_encoded(self.persist_dir, self.chunks, stored, scales,
+                                       self.full_dims, self.embedding), "numpy"
+
+
+# ---------- pipeline ----------
+def run_pipeline(
+    pdf_path: str,
+    split: Splitter,
+    embedding: Embeddings,
+    sink,
+    on_chunks: Optional[Callable[[List[Document]], None]] = None,
+    on_extracted: Optional[Callable[[], None]] = None,
+    progress: Progress = lambda stage, fraction: None,
+) -> int:
+    """
+    Stream the PDF through split -> embed -> sink.add and return the chunk count.
+
+    split is called one page at a time, so a chunk never spans two pages.
+    on_chunks, if given, receives each page's chunks as they are split, and
+    on_extracted is called once extraction has finished (while embedding is
+    still running) — the retriever grows its lexical index in the first and
+    publishes it in the second. The queues between stages are bounded; what
+    `sink` and on_chunks keep is up to them.
+    """
+    total_pages = max(1, count_pdf_pages(pdf_path))
+    stop = threading.Event()
+    chunk_q: queue.Queue = queue.Queue(maxsize=QUEUE_DEPTH)
+    vector_q: queue.Queue = queue.Queue(maxsize=QUEUE_DEPTH)
+
+    def chunk_batches():
+        batch: List[Document] = []
+        for page in iter_pdf_pages(pdf_path):
+            chunks = split([page])
+            if on_chunks:
+                on_chunks(chunks)
+            for c in chunks:
+                batch.append(c)
+                if len(batch) >= EMBED_BATCH_SIZE:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+        if on_extracted:
+            on_extracted()
+
+    def embedded_batches():
+        for batch in _drain(chunk_q, stop):
+            yield batch, embedding.embed_documents([d.page_content for d in batch])
+
+    _start_stage("extract", chunk_batches, chunk_q, stop)
+    _start_stage("embed", embedded_batches, vector_q, stop)
+
+    n = 0
+    try:
+        for docs, vectors in _drain(vector_q, stop):
+            sink.add(docs, vectors)
+            n += len(docs)
+            page = docs[-1].metadata.get("page", 0) + 1
+            progress("embedding", 0.3 + 0.65 * min(1.0, page / total_pages))
+    finally:
+        stop.set()          # unblock upstream stages if we bailed out early
+    return n
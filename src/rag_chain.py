@@ -1,11 +1,11 @@
 # src/rag_chain.py
 
-from langchain_community.vectorstores import Chroma
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from src.config import OPENAI_API_KEY, EMBEDDING_MODEL, CHAT_MODEL
+from src.config import CHAT_MODEL
+from src.openai_client import get_client
 from src.retriever import search
 
 TOP_K = 3  # 检索仍然3条，但只展示最相关的1条
+DEFAULT_PDF_PATH = "./data/tenancy_agreement.pdf"
 
 SYSTEM_PROMPT = """
 You are a helpful assistant that answers questions based ONLY on the provided tenancy agreement.
@@ -17,9 +17,11 @@ Rules:
 4. DO NOT output references in your main answer. References will be added later.
 """
 
-def answer(question: str):
+def answer(question: str, pdf_path: str = DEFAULT_PDF_PATH):
     # 1) Retrieve contract clauses
-    results = search(question, top_k=TOP_K)
+    results = search(question, top_k=TOP_K, active_pdf_path=pdf_path)
+    if not results:
+        return "The agreement does not specify."
 
     # Top-1 for reference (most relevant)
     top_clause = results[0]
@@ -29,24 +31,21 @@ def answer(question: str):
     # 2) Build context for LLM (still use top-3 as knowledge)
     context = "\n\n".join([doc.page_content for doc in results])
 
-    # 3) Prepare LLM
-    llm = ChatOpenAI(
-        api_key=OPENAI_API_KEY,
-        model=CHAT_MODEL,
-        temperature=0.2
-    )
-
-    # 4) Prompt LLM
+    # 3) Prompt LLM (shared pooled client, see src/openai_client.py)
     messages = [
-        ("system", SYSTEM_PROMPT),
-        ("user", f"Context:\n{context}\n\nQuestion: {question}")
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}
     ]
 
-    response = llm.invoke(messages)
+    response = get_client().chat.completions.create(
+        model=CHAT_MODEL,
+        messages=messages,
+        temperature=0.2
+    )
 
-    # 5) Assemble final formatted answer
+    # 4) Assemble final formatted answer
     final_answer = (
-        f"{response.content.strip()}\n\n"
+        f"{response.choices[0].message.content.strip()}\n\n"
         f"Reference:\n"
         f"- Clause (Page {page_num}): \"{top_text}\""
     )
@@ -1,43 +1,127 @@
 # src/retriever.py
-import os, hashlib, json, shutil
-from typing import Tuple
+import os, json, hashlib, shutil, threading
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional, Tuple, Union
 
+import numpy as np
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.documents import Document
 
-# For modern LangChain:
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-# If you're on OLD LangChain (<0.1.0), replace the two lines above with:
-# from langchain.document_loaders import PyPDFLoader
-# from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-from src.config import OPENAI_API_KEY, EMBEDDING_MODEL
+from src.config import EMBEDDING_MODEL, SEARCH_DIMENSIONS, THRESHOLD_CAN_ANSWER
+from src.loader import chunking_config, get_splitter, load_pdf_pages
+from src.clause_chunker import ClauseChunker, has_top_level_heading
+from src.signature import file_signature, page_signatures
+from src.embedding_cache import get_embeddings
+from src.vector_index import NumpyIndex, QUANTIZATION
+from src.lexical import LexicalIndex, LexicalHit, lexical_distance
+from src.store_registry import StoreRegistry
+from src.pipeline import IndexSink, run_pipeline
+from src import topics
 
 VECTOR_STORE_BASE_DIR = "./vector_store"
-SIG_FILENAME = "store_signature.json"   # records md5 + source path
+SIG_FILENAME = "store_signature.json"   # records content signature + source path + backend + page hashes
+
+# Store directories are named <content sig>-<index fingerprint>: the
+# fingerprint covers the chunking config and embedding settings, so variants
+# of the same contract (grid search, config changes) live side by side and
+# switching back to one is a cache hit instead of a rebuild.
+
+# Stores up to this many chunks use the exact NumPy backend (one mat-vec per
+# query); bigger ones stay on Chroma/HNSW.
+NUMPY_INDEX_MAX_CHUNKS = 5000
+
+# A new version of an already-indexed PDF (same source path) is built by
+# copying the previous store and re-indexing only the pages whose content
+# hash changed — unless most of the document changed anyway.
+INCREMENTAL_MAX_CHANGED_RATIO = 0.5
+
+# Disk budget GC (see src/store_registry.py). The current version of these
+# PDFs is never evicted.
+PINNED_PDF_PATHS = ("./data/tenancy_agreement.pdf",)
+_REGISTRY = StoreRegistry(VECTOR_STORE_BASE_DIR)
+
+# While a dense index is being built, queries for that PDF are answered from
+# the lexical index over the already-extracted text instead of blocking
+# (see _lexical_while_building).
+
+Progress = Callable[[str, float], None]  # (stage, fraction 0..1)
+
+def _no_progress(stage: str, fraction: float):
+    pass
+
+# Process-wide registry of opened stores, keyed by content signature.
+# Warm queries reuse the handle instead of re-reading the signature file and
+# constructing new embedding / Chroma clients.
+STORE_CACHE_MAX_MB = 256                 # rough memory budget for cached stores
+STORE_CACHE_MAX_ENTRIES = 16
+EST_BYTES_PER_CHUNK = 1536 * 4 + 2048    # float32 vector + text/metadata overhead
+
+# Hybrid search: BM25 results are fused with dense results (reciprocal rank
+# fusion). A decisive keyword match skips the query-embedding call entirely.
+HYBRID_SEARCH = True
+RRF_K = 60
+
+CHROMA_UPDATE_BATCH = 1000       # metadata rows per update when writing topic labels into a chroma store
+
+# Range search (search_range): k starts here and doubles until the k-th
+# neighbour is past the distance bound.
+RANGE_START_K = 8
+
+Store = Union[Chroma, NumpyIndex]
+
+class _OpenStore(NamedTuple):
+    store: Store
+    lexical: LexicalIndex
+    persist_dir: str
+    topics: Optional[dict] = None          # topics.json: counts + centroids
+
+_STORE_CACHE: "OrderedDict[str, Tuple[_OpenStore, int]]" = OrderedDict()  # store key -> (handle, bytes)
+_STORE_CACHE_BYTES = 0
+_STORE_CACHE_LOCK = threading.Lock()
+_BUILD_LOCKS = {}                        # store key -> Lock, so one build per store
+
+
+class _PendingBuild:
+    def __init__(self):
+        self.lexical: Optional[LexicalIndex] = None
+        self.extracted = threading.Event()   # set once `lexical` is usable
+
+_PENDING = {}                            # store key -> _PendingBuild
 
 
 # ---------- helpers ----------
-def _md5(path: str) -> str:
-    try:
-        with open(path, "rb") as f:
-            return hashlib.md5(f.read()).hexdigest()
-    except Exception:
-        return "no-file"
+def index_config() -> dict:
+    """Everything besides the PDF content that shapes a store's chunks and vectors."""
+    return dict(chunking_config(), embedding_model=EMBEDDING_MODEL,
+                search_dimensions=SEARCH_DIMENSIONS, quantization=QUANTIZATION)
 
-def _persist_dir_for_pdf(pdf_path: str) -> Tuple[str, str]:
-    """
-    Use file CONTENT signature for a unique per-file directory.
-    """
-    sig = _md5(pdf_path)
-    d = os.path.join(VECTOR_STORE_BASE_DIR, sig)
-    os.makedirs(d, exist_ok=True)
-    return d, sig
+def index_fingerprint() -> str:
+    blob = json.dumps(index_config(), sort_keys=True).encode()
+    return hashlib.blake2b(blob, digest_size=4).hexdigest()
+
+def store_key(pdf_path: str, sig: Optional[str] = None) -> str:
+    """Key (and directory name) of the store for this PDF's content under the current config."""
+    return f"{sig or file_signature(pdf_path)}-{index_fingerprint()}"
+
+def _persist_dir_name(key: str) -> str:
+    return os.path.join(VECTOR_STORE_BASE_DIR, key)
 
-def _write_signature(persist_dir: str, pdf_path: str, sig: str):
+def _write_signature(persist_dir: str, pdf_path: str, sig: str, backend: str, pages: List[str]):
     with open(os.path.join(persist_dir, SIG_FILENAME), "w", encoding="utf-8") as f:
-        json.dump({"pdf_path": pdf_path, "md5": sig}, f, indent=2)
+        json.dump({"pdf_path": pdf_path, "sig": sig, "backend": backend, "pages": pages,
+                   "fingerprint": index_fingerprint(), "index_config": index_config()}, f, indent=2)
+
+def _clear_dir(persist_dir: str):
+    if os.path.isdir(persist_dir):
+        for name in os.listdir(persist_dir):
+            p = os.path.join(persist_dir, name)
+            if os.path.isdir(p):
+                shutil.rmtree(p, ignore_errors=True)
+            else:
+                try:
+                    os.remove(p)
+                except:
+                    pass
 
 def _read_signature(persist_dir: str) -> dict:
     p = os.path.join(persist_dir, SIG_FILENAME)
@@ -50,94 +134,601 @@ def _read_signature(persist_dir: str) -> dict:
         return {}
 
 
+# ---------- store handle cache ----------
+def _estimate_store_bytes(store: Store) -> int:
+    try:
+        n = _store_count(store)
+    except Exception:
+        n = 0
+    if isinstance(store, NumpyIndex):
+        # quantized stores hold int8/float16 rows, not float32
+        return store.vectors.nbytes + max(n, 1) * (EST_BYTES_PER_CHUNK - 1536 * 4)
+    return max(n, 1) * EST_BYTES_PER_CHUNK
+
+def _cache_get(key: str):
+    with _STORE_CACHE_LOCK:
+        entry = _STORE_CACHE.get(key)
+        if entry is None:
+            return None
+        _STORE_CACHE.move_to_end(key)
+        return entry[0]
+
+def _cache_put(key: str, handle: _OpenStore):
+    global _STORE_CACHE_BYTES
+    size = _estimate_store_bytes(handle.store)
+    budget = STORE_CACHE_MAX_MB * 1024 * 1024
+    with _STORE_CACHE_LOCK:
+        old = _STORE_CACHE.pop(key, None)
+        if old is not None:
+            _STORE_CACHE_BYTES -= old[1]
+        _STORE_CACHE[key] = (handle, size)
+        _STORE_CACHE_BYTES += size
+        # evict least-recently-used handles, but always keep the newest one
+        while len(_STORE_CACHE) > 1 and (
+            _STORE_CACHE_BYTES > budget or len(_STORE_CACHE) > STORE_CACHE_MAX_ENTRIES
+        ):
+            evicted_key, (_, evicted_size) = _STORE_CACHE.popitem(last=False)
+            _STORE_CACHE_BYTES -= evicted_size
+            print(f"[retriever] Evicted cached store: {evicted_key}")
+
+def _build_lock(key: str) -> threading.Lock:
+    with _STORE_CACHE_LOCK:
+        return _BUILD_LOCKS.setdefault(key, threading.Lock())
+
+
 # ---------- build / load ----------
-def _build_store(pdf_path: str, persist_dir: str) -> Tuple[Chroma, int]:
+def _split_changed_pages(
+    pdf_path: str, changed: List[int], n_pages: int, stored: Callable[[int], List[Tuple[str, Optional[str]]]]
+) -> Tuple[List[Document], set]:
+    """
+    Chunks for the given pages, and the set of pages they replace (the
+    splitter never lets a chunk span two pages, which is what incremental
+    updates rely on).
+
+    The clause chunker carries clause state from page to page, so with it
+    earlier pages are chunked too — back to the nearest page that opens a
+    top-level clause — so continuation text and sub-clauses keep their
+    clause_id; those extra chunks are dropped. Likewise an amendment can
+    renumber what follows it: the pages after each changed run are
+    re-chunked, and replaced, until one comes out the same as `stored(page)`
+    says it was, as (text, clause_id) pairs.
+    """
+    splitter = get_splitter()
+    wanted = set(changed)
+    if not isinstance(splitter, ClauseChunker):
+        return splitter.split_documents(load_pdf_pages(pdf_path, wanted)), wanted
+
+    context = set(wanted)
+    for i in sorted(wanted):
+        j = i - 1
+        while j >= 0 and j not in context:
+            context.add(j)
+            if has_top_level_heading(load_pdf_pages(pdf_path, [j])[0].page_content):
+                break
+            j -= 1
+
+    chunks: List[Document] = []
+    todo = sorted(context)
+    while todo:
+        page = todo.pop(0)
+        page_chunks = splitter.split_page(load_pdf_pages(pdf_path, [page])[0])
+        if page not in context:
+            # a page after a changed run: done once it chunks the way it is stored
+            if sorted((c.page_content, c.metadata.get("clause_id")) for c in page_chunks) == sorted(stored(page)):
+                continue
+            wanted.add(page)
+        if page in wanted:
+            chunks.extend(page_chunks)
+            if page + 1 < n_pages and page + 1 not in context:
+                todo.insert(0, page + 1)
+    return chunks, wanted
+
+def _build_store(
+    pdf_path: str, persist_dir: str, pending: Optional[_PendingBuild] = None, progress: Progress = _no_progress
+) -> Tuple[Store, int, str]:
     print(f"[retriever] Building store from: {pdf_path}")
-    loader = PyPDFLoader(pdf_path)
-    docs = loader.load()
+    progress("extracting", 0.05)
+
+    # grown page by page on the extraction thread; nobody searches it before on_extracted
+    lexical = LexicalIndex()
+
+    def on_extracted():
+        # runs on the extraction thread while embedding is still in flight
+        print(f"[retriever] Split into {len(lexical.chunks)} chunks")
+        lexical.save(persist_dir)
+        if pending is not None:
+            pending.lexical = lexical
+            pending.extracted.set()
+        progress("embedding", 0.3)
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = splitter.split_documents(docs)
-    print(f"[retriever] Split into {len(chunks)} chunks")
+    # pages -> chunks -> embedding batches -> upserts, stages overlapping (src/pipeline.py)
+    sink = IndexSink(persist_dir, get_embeddings(), NUMPY_INDEX_MAX_CHUNKS)
+    n_chunks = run_pipeline(pdf_path, get_splitter().split_documents, get_embeddings(), sink,
+                            lexical.add, on_extracted, progress)
+    store, backend = sink.finish()
+    print(f"[retriever] Backend: {backend}")
+    return store, n_chunks, backend
 
-    embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY, model=EMBEDDING_MODEL)
-    store = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
+def _open_store(persist_dir: str, backend: str) -> Store:
+    if backend == "numpy":
+        store = NumpyIndex.load(persist_dir, get_embeddings())
+        if store.quantized or store.dims != store.full_dims:
+            # rescoring reads these chunks' full vectors from the embedding cache: keep them through pruning
+            get_embeddings().touch_documents([c["text"] for c in store.chunks])
+        return store
+    return Chroma(
         persist_directory=persist_dir,
+        embedding_function=get_embeddings(),
         collection_metadata={"hnsw:space": "cosine"},
     )
-    store.persist()
-    return store, len(chunks)
 
-def _load_or_rebuild(pdf_path: str) -> Tuple[Chroma, str]:
-    persist_dir, sig = _persist_dir_for_pdf(pdf_path)
+def _store_chunks(store: Store) -> List[Document]:
+    """All chunks held by a store, in index order."""
+    if isinstance(store, NumpyIndex):
+        return [store._doc(i) for i in range(store.count())]
+    got = store.get(include=["documents", "metadatas"])
+    return [Document(page_content=t, metadata=m or {}) for t, m in zip(got["documents"], got["metadatas"])]
+
+def _open_lexical(persist_dir: str, store: Store) -> LexicalIndex:
+    if LexicalIndex.exists(persist_dir):
+        return LexicalIndex.load(persist_dir)
+    # stores built before the lexical index existed: derive it from their chunks
+    print(f"[retriever] Building lexical index for: {persist_dir}")
+    return LexicalIndex.build(persist_dir, _store_chunks(store))
+
+def _assign_topics(store: Store, persist_dir: str) -> Optional[dict]:
+    """Label every chunk with its topic, rebuild the lexical index with it, save centroids."""
+    try:
+        if isinstance(store, NumpyIndex):
+            vectors = store._dequantized(np.arange(store.count()))
+            docs = _store_chunks(store)
+            labels = topics.assign_topics(docs, vectors)
+            store.set_metadata("topic", labels)
+        else:
+            got = store._collection.get(include=["embeddings", "metadatas", "documents"])
+            vectors = np.asarray(got["embeddings"], dtype=np.float32)
+            docs = [Document(page_content=t, metadata=m or {}) for t, m in zip(got["documents"], got["metadatas"])]
+            labels = topics.assign_topics(docs, vectors)
+            for i in range(0, len(docs), CHROMA_UPDATE_BATCH):
+                store._collection.update(
+                    ids=got["ids"][i:i + CHROMA_UPDATE_BATCH],
+                    metadatas=[dict(d.metadata, topic=t) for d, t in
+                               zip(docs[i:i + CHROMA_UPDATE_BATCH], labels[i:i + CHROMA_UPDATE_BATCH])],
+                )
+        for d, t in zip(docs, labels):
+            d.metadata["topic"] = t
+        LexicalIndex.build(persist_dir, docs)
+        topics.save(persist_dir, labels, vectors)
+        data = topics.load(persist_dir)
+        print(f"[retriever] Topics: {dict(sorted(data['counts'].items()))}")
+        return data
+    except Exception as e:
+        # routing falls back to searching the whole store
+        print(f"[retriever][WARN] Topic assignment failed: {e}")
+        return None
+
+def _stored_page(store: Store, page: int) -> List[Tuple[str, Optional[str]]]:
+    """(text, clause_id) of the chunks a store holds for one page."""
+    if isinstance(store, NumpyIndex):
+        metas = [(c["text"], c["metadata"]) for c in store.chunks if c["metadata"].get("page") == page]
+    else:
+        got = store.get(where={"page": page})
+        metas = list(zip(got["documents"], got["metadatas"]))
+    return [(text, (meta or {}).get("clause_id")) for text, meta in metas]
+
+def _store_count(store: Store) -> int:
+    return store.count() if isinstance(store, NumpyIndex) else store._collection.count()
+
+def _find_previous_store(pdf_path: str, exclude_dir: str) -> Optional[Tuple[str, dict]]:
+    """Most recently written store for the same source path and index config that recorded page hashes."""
+    if not os.path.isdir(VECTOR_STORE_BASE_DIR):
+        return None
+    target = os.path.abspath(pdf_path)
+    best = None
+    for name in os.listdir(VECTOR_STORE_BASE_DIR):
+        d = os.path.join(VECTOR_STORE_BASE_DIR, name)
+        if d == exclude_dir or name.startswith(".") or not os.path.isdir(d):
+            continue
+        rec = _read_signature(d)
+        if not rec.get("pages") or os.path.abspath(rec.get("pdf_path", "")) != target \
+                or rec.get("fingerprint") != index_fingerprint():
+            continue
+        mtime = os.path.getmtime(os.path.join(d, SIG_FILENAME))
+        if best is None or mtime > best[0]:
+            best = (mtime, d, rec)
+    return (best[1], best[2]) if best else None
+
+def _update_incrementally(pdf_path: str, persist_dir: str, pages: List[str]) -> Optional[Tuple[Store, int, str]]:
+    """
+    Re-index only amended pages, starting from a copy of the previous store
+    for this PDF. Returns None when there is nothing suitable to start from.
+    """
+    prev = _find_previous_store(pdf_path, persist_dir)
+    if prev is None:
+        return None
+    prev_dir, rec = prev
+    old_pages = rec["pages"]
+    changed = {
+        i for i in range(max(len(old_pages), len(pages)))
+        if i >= len(old_pages) or i >= len(pages) or old_pages[i] != pages[i]
+    }
+    if len(changed) > max(1, len(pages)) * INCREMENTAL_MAX_CHANGED_RATIO:
+        return None
+
+    backend = rec.get("backend", "chroma")
+    print(f"[retriever] Incremental update from {prev_dir}: {len(changed)} changed page(s) {sorted(changed)}")
+    shutil.copytree(prev_dir, persist_dir, dirs_exist_ok=True)
+    os.remove(os.path.join(persist_dir, SIG_FILENAME))
+
+    store = _open_store(persist_dir, backend)
+    new_chunks, renumbered = _split_changed_pages(
+        pdf_path, [i for i in changed if i < len(pages)], len(pages), lambda page: _stored_page(store, page))
+    if renumbered - changed:
+        print(f"[retriever] Clause numbering shifted on page(s) {sorted(renumbered - changed)}, re-indexing them too")
+    changed |= renumbered
+    if isinstance(store, NumpyIndex):
+        store = store.replace_pages(changed, new_chunks)
+    else:
+        stale = store.get(where={"page": {"$in": sorted(changed)}})["ids"] if changed else []
+        if stale:
+            store.delete(ids=stale)
+        if new_chunks:
+            store.add_documents(new_chunks)
+    LexicalIndex.build(persist_dir, _store_chunks(store))
+    return store, _store_count(store), backend
+
+def _collect_garbage():
+    """Evict old stores over the disk budget, sparing open and pinned ones."""
+    with _STORE_CACHE_LOCK:
+        protect = [h.persist_dir for h, _ in _STORE_CACHE.values()]
+    protect += [_persist_dir_name(store_key(p)) for p in PINNED_PDF_PATHS]
+    try:
+        _REGISTRY.collect(protect=protect)
+    except Exception as e:
+        print(f"[retriever][WARN] Store GC failed: {e}")
+
+def _load_or_rebuild(pdf_path: str, sig: str, key: str, progress: Progress = _no_progress) -> _OpenStore:
+    persist_dir = _persist_dir_name(key)
+    os.makedirs(persist_dir, exist_ok=True)
+    # mark in-use BEFORE reading, so a concurrent GC leaves it alone
+    _REGISTRY.touch(persist_dir, pdf_path, force=True)
 
     # If signature mismatches (or missing), nuke & rebuild to avoid staleness
     recorded = _read_signature(persist_dir)
-    needs_rebuild = (recorded.get("md5") != sig)
+    backend = recorded.get("backend", "chroma")
+    needs_rebuild = (recorded.get("sig") != sig) or (
+        backend == "numpy" and not NumpyIndex.exists(persist_dir)
+    )
 
     if needs_rebuild:
         # clear the dir so we don't accidentally reuse stale sqlite
-        if os.path.isdir(persist_dir):
-            for name in os.listdir(persist_dir):
-                p = os.path.join(persist_dir, name)
-                if os.path.isdir(p):
-                    shutil.rmtree(p, ignore_errors=True)
-                else:
-                    try:
-                        os.remove(p)
-                    except:
-                        pass
-
-        store, n_chunks = _build_store(pdf_path, persist_dir)
-        _write_signature(persist_dir, pdf_path, sig)
+        _clear_dir(persist_dir)
+
+        pending = _PENDING.setdefault(key, _PendingBuild())
+        try:
+            pages = page_signatures(pdf_path)
+            built = None
+            try:
+                built = _update_incrementally(pdf_path, persist_dir, pages)
+            except Exception as e:
+                print(f"[retriever][WARN] Incremental update failed, full rebuild: {e}")
+                _clear_dir(persist_dir)
+            store, n_chunks, backend = built or _build_store(pdf_path, persist_dir, pending, progress)
+        finally:
+            _PENDING.pop(key, None)
+        topic_data = _assign_topics(store, persist_dir) if n_chunks else None
+        _write_signature(persist_dir, pdf_path, sig, backend, pages)
+        _REGISTRY.record(persist_dir, pdf_path)
         print(f"[retriever] Persisted to: {persist_dir}")
         if n_chunks == 0:
             print("[retriever][WARN] 0 chunks created — PDF may be empty or loader failed.")
-        return store, persist_dir
+        return _OpenStore(store, LexicalIndex.load(persist_dir), persist_dir, topic_data)
 
     # Signature matches → load existing
-    print(f"[retriever] Loading existing store: {persist_dir}")
-    embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY, model=EMBEDDING_MODEL)
-    store = Chroma(
-        persist_directory=persist_dir,
-        embedding_function=embeddings,
-        collection_metadata={"hnsw:space": "cosine"},
+    print(f"[retriever] Loading existing store ({backend}): {persist_dir}")
+    store = _open_store(persist_dir, backend)
+    topic_data = topics.load(persist_dir)
+    if topic_data is None and _store_count(store):
+        # built before topics existed, or with an older keyword map
+        topic_data = _assign_topics(store, persist_dir)
+    return _OpenStore(store, _open_lexical(persist_dir, store), persist_dir, topic_data)
+
+def _get_store(pdf_path: str, progress: Progress = _no_progress) -> _OpenStore:
+    """Return a cached store handle for the PDF, opening/building it on first use."""
+    sig = file_signature(pdf_path)   # stat-only when the file is unchanged
+    key = store_key(pdf_path, sig)
+    hit = _cache_get(key)
+    if hit is not None:
+        _REGISTRY.touch(hit.persist_dir)      # throttled, no filesystem scan
+        return hit
+
+    with _build_lock(key):
+        # another thread may have opened it while we waited
+        hit = _cache_get(key)
+        if hit is not None:
+            return hit
+        handle = _load_or_rebuild(pdf_path, sig, key, progress)
+        _cache_put(key, handle)
+    _collect_garbage()
+    return handle
+
+def _lexical_while_building(key: str) -> Optional[LexicalIndex]:
+    """
+    The interim lexical index if store `key` is mid-build, else None. Never
+    waits: until text extraction has finished (or during an incremental
+    update) the interim index is empty, so a query finds nothing yet instead
+    of blocking the UI on the build.
+    """
+    pending = _PENDING.get(key)
+    if pending is None or _cache_get(key) is not None:
+        return None
+    if not pending.extracted.is_set() or pending.lexical is None:
+        print("[retriever] Contract text still being extracted — no interim results yet")
+        return LexicalIndex()
+    return pending.lexical
+
+
+def _query_vectors(store: Store, vectors: List[List[float]], top_k: int) -> List[List[Tuple[Document, float]]]:
+    """k-NN for a batch of query vectors against either backend."""
+    if isinstance(store, NumpyIndex):
+        return store.search_many_by_vectors(vectors, k=top_k)
+
+    res = store._collection.query(
+        query_embeddings=vectors,
+        n_results=top_k,
+        include=["documents", "metadatas", "distances"],
     )
-    return store, persist_dir
+    return [
+        [(Document(page_content=t, metadata=m or {}), d) for t, m, d in zip(texts, metas, dists)]
+        for texts, metas, dists in zip(res["documents"], res["metadatas"], res["distances"])
+    ]
+
+def _with_scores(pairs) -> List[Document]:
+    out = []
+    for doc, score in pairs:
+        doc.metadata["score"] = float(score)
+        out.append(doc)
+    return out
+
+def _best_first(docs: List[Document]) -> List[Document]:
+    """Move the best-scoring doc to the front (it is the one that decides can-answer)."""
+    if docs:
+        best = min(docs, key=lambda d: d.metadata["score"])
+        docs.remove(best)
+        docs.insert(0, best)
+    return docs
+
+def _lexical_only(hits: List[LexicalHit]) -> List[Document]:
+    for h in hits:
+        h.doc.metadata["match"] = "lexical"
+    return _best_first(_with_scores((h.doc, lexical_distance(h.coverage)) for h in hits))
+
+def _fast_path(lexical: LexicalIndex, query: str, hits: List[LexicalHit]) -> bool:
+    """
+    BM25 alone answers the query: the match is decisive and its calibrated
+    distance (lexical.BEST_LEXICAL_DISTANCE) clears THRESHOLD_CAN_ANSWER.
+    If the threshold is tuned below it, the decision goes back to dense.
+    """
+    return lexical.is_decisive(query, hits) and lexical_distance(hits[0].coverage) < THRESHOLD_CAN_ANSWER
+
+def _fuse(dense_pairs, hits: List[LexicalHit], top_k: int) -> List[Document]:
+    """
+    Reciprocal rank fusion of dense and BM25 results.
+
+    Dense hits keep their cosine distance as score. Lexical-only hits get a
+    coverage-based distance, never better than the best dense score, so the
+    can-answer decision (min score vs THRESHOLD_CAN_ANSWER) stays dense-driven.
+    The best-scoring chunk is moved to the front: it decided can-answer, so
+    it must lead the context and be the reference, whatever its RRF rank.
+    """
+    dense_best = min((float(s) for _, s in dense_pairs), default=1.0)
+    fused = {}   # (page, text) -> [doc, rrf]
+    for rank, (doc, score) in enumerate(dense_pairs):
+        doc.metadata["score"] = float(score)
+        fused[(doc.metadata.get("page"), doc.page_content)] = [doc, 1.0 / (RRF_K + rank + 1)]
+    for rank, h in enumerate(hits):
+        key = (h.doc.metadata.get("page"), h.doc.page_content)
+        if key in fused:
+            fused[key][1] += 1.0 / (RRF_K + rank + 1)
+        else:
+            h.doc.metadata["score"] = max(lexical_distance(h.coverage), dense_best)
+            fused[key] = [h.doc, 1.0 / (RRF_K + rank + 1)]
+    ranked = sorted(fused.values(), key=lambda e: e[1], reverse=True)
+    return _best_first([doc for doc, _ in ranked])[:top_k]
 
 
 # ---------- public API ----------
-def search(query: str, top_k: int = 5, with_scores: bool = False, *, active_pdf_path: str):
+def search(query: str, top_k: int = 5, with_scores: bool = False, *, active_pdf_path: str,
+           topic_filter: Optional[List[str]] = None):
     """
     Search chunks for the specified PDF. Rebuilds the store automatically
     if the on-disk signature doesn't match the current file content.
 
+    With scores, results are hybrid (dense + BM25, see _fuse): results[0]
+    is the best (MIN) score, the rest follow in fused rank order.
+
+    `topic_filter` restricts the search to those topic partitions (see
+    route_topics); None searches every chunk.
+
     NOTE: active_pdf_path is REQUIRED to avoid circular imports.
     """
     pdf = active_pdf_path
     if not pdf or not os.path.exists(pdf):
         raise FileNotFoundError(f"Active PDF not found: {pdf}")
 
-    store, persist_dir = _load_or_rebuild(pdf)
+    interim = _lexical_while_building(store_key(pdf))
+    if interim is not None:
+        hits = interim.search(query, k=top_k)    # no topic labels yet: search everything
+        print(f"[retriever] Dense index still building — lexical answer for: {query}")
+        return _lexical_only(hits) if with_scores else [h.doc for h in hits]
+
+    store, lexical, persist_dir, _ = _get_store(pdf)
     print(f"[retriever] Query: {query}")
     print(f"[retriever] Using store: {persist_dir}")
+    where = {"topic": {"$in": list(topic_filter)}} if topic_filter else None
+    if where:
+        print(f"[retriever] Topic partitions: {topic_filter}")
 
-    if with_scores:
-        pairs = store.similarity_search_with_score(query, k=top_k)
-        out = []
-        top_scores = []
-        for doc, score in pairs:
-            doc.metadata["score"] = float(score)
-            out.append(doc)
-            top_scores.append(float(score))
-        if top_scores:
-            print(f"[retriever] Top scores: {top_scores}")
-        return out
-    else:
+    if not with_scores and not where:
         return store.similarity_search(query, k=top_k)
 
+    if HYBRID_SEARCH or where:
+        hits = lexical.search(query, k=top_k, topic_filter=topic_filter)
+        cached_vec = get_embeddings().peek_query(query)
+        if cached_vec is None and _fast_path(lexical, query, hits):
+            # exact contract vocabulary: answer from BM25, skip the embedding call
+            out = _lexical_only(hits)
+            print(f"[retriever] Lexical fast path, top scores: {[d.metadata['score'] for d in out]}")
+            return out
+        vec = cached_vec or get_embeddings().embed_query(query)
+        dense = store.similarity_search_by_vector_with_relevance_scores(vec, k=top_k, filter=where)
+        out = _fuse(dense, hits, top_k)
+    else:
+        out = _with_scores(store.similarity_search_with_score(query, k=top_k))
+
+    if out:
+        print(f"[retriever] Top scores: {[d.metadata['score'] for d in out]}")
+    return out
+
+
+def search_range(query: str, max_distance: float, *, active_pdf_path: str,
+                 topic_filter: Optional[List[str]] = None, max_k: int = 50) -> List[Document]:
+    """
+    Every chunk scoring below max_distance (at most max_k), best first, with
+    metadata["score"] like search(..., with_scores=True).
+
+    Dense neighbours are fetched RANGE_START_K at a time, doubling k only
+    while the k-th one is still within the bound — an answer that needs
+    six clauses costs one small query, not a fixed top-50. The bound is a
+    cosine distance, so BM25-only hits (whose scores are estimates) are
+    not added, except while the dense index is still building.
+    """
+    pdf = active_pdf_path
+    if not pdf or not os.path.exists(pdf):
+        raise FileNotFoundError(f"Active PDF not found: {pdf}")
+
+    interim = _lexical_while_building(store_key(pdf))
+    if interim is not None:
+        out = _lexical_only(interim.search(query, k=max_k))
+        return [d for d in out if d.metadata["score"] < max_distance]
+
+    store, _, _, _ = _get_store(pdf)
+    where = {"topic": {"$in": list(topic_filter)}} if topic_filter else None
+    vec = get_embeddings().embed_query(query)         # cached after the probe search
+    k = min(RANGE_START_K, max_k)
+    while True:
+        dense = store.similarity_search_by_vector_with_relevance_scores(vec, k=k, filter=where)
+        if len(dense) < k or k >= max_k or dense[-1][1] >= max_distance:
+            break
+        k = min(k * 2, max_k)
+    out = _with_scores((d, s) for d, s in dense if s < max_distance)
+    print(f"[retriever] Range search (< {max_distance}) with k={k}: {len(out)} chunks")
+    return out
+
+
+def search_many(queries: List[str], top_k: int = 5, *, active_pdf_path: str) -> List[List[Document]]:
+    """
+    Batched search(..., with_scores=True): embeds every query in one request
+    (cache misses only), scores them against the store in one matrix
+    operation, then fuses each with its BM25 hits (_fuse) like search().
+
+    Returns one result list per query, in order. Every query ends up with a
+    cached embedding, so the results are what search() returns for it from
+    then on — never the lexical fast path, which search() takes only for
+    an uncached query.
+    """
+    pdf = active_pdf_path
+    if not pdf or not os.path.exists(pdf):
+        raise FileNotFoundError(f"Active PDF not found: {pdf}")
+    if not queries:
+        return []
+
+    interim = _lexical_while_building(store_key(pdf))
+    if interim is not None:
+        return [_lexical_only(interim.search(q, k=top_k)) for q in queries]
+
+    store, lexical, persist_dir, _ = _get_store(pdf)
+    print(f"[retriever] Batch of {len(queries)} queries, store: {persist_dir}")
+
+    vectors = get_embeddings().embed_queries(queries)
+    dense = _query_vectors(store, vectors, top_k)
+    if not HYBRID_SEARCH:
+        return [_with_scores(pairs) for pairs in dense]
+    return [_fuse(pairs, lexical.search(q, k=top_k), top_k) for q, pairs in zip(queries, dense)]
+
+
+def takes_lexical_fast_path(query: str, *, active_pdf_path: str) -> bool:
+    """
+    True if search(..., with_scores=True) answers this query from BM25 alone
+    whenever its embedding isn't cached (test_classification.py reports these).
+    """
+    _, lexical, _, _ = _get_store(active_pdf_path)
+    return _fast_path(lexical, query, lexical.search(query, k=5))
+
+
+def will_embed_query(query: str, *, active_pdf_path: str, fast_path: bool = True) -> bool:
+    """
+    True if retrieval for this query is going to call the embeddings API:
+    the dense index is ready, the query vector isn't cached and — with
+    `fast_path`, i.e. for search(..., with_scores=True) alone — BM25 doesn't
+    settle it. route_topics and search_range always embed: pass False.
+    The async callers await the embedding on the event loop only then.
+    """
+    pdf = active_pdf_path
+    if _lexical_while_building(store_key(pdf)) is not None:
+        return False
+    if get_embeddings().peek_query(query) is not None:
+        return False
+    if not (fast_path and HYBRID_SEARCH):
+        return True
+    _, lexical, _, _ = _get_store(pdf)
+    return not _fast_path(lexical, query, lexical.search(query, k=5))
+
+
+def route_topics(query: str, *, active_pdf_path: str) -> Optional[List[str]]:
+    """
+    Topic partitions a comprehensive question should search: the topics its
+    keywords name plus the ones whose centroids are nearest the query.
+    None = no routing (no topic data, or the store is still building).
+    """
+    pdf = active_pdf_path
+    if _lexical_while_building(store_key(pdf)) is not None:
+        return None
+    data = _get_store(pdf).topics
+    if not data:
+        return None
+    vec = get_embeddings().embed_query(query)     # cached: search() reuses it
+    named = topics.route(query, vec, data)
+    print(f"[retriever] Routed to topics: {named}")
+    return named
+
+
+def announce_build(pdf_path: str) -> str:
+    """
+    Mark the PDF's store as being built in the background (until ensure_store
+    returns): queries meanwhile get the interim — possibly still empty —
+    lexical answer instead of building the store themselves or queueing
+    behind the build lock. Returns the store key.
+    """
+    key = store_key(pdf_path)
+    if _cache_get(key) is None:
+        _PENDING.setdefault(key, _PendingBuild())
+    return key
+
+def ensure_store(pdf_path: str, progress: Progress = _no_progress) -> str:
+    """Open or build the store for a PDF (used by background ingestion). Returns its directory."""
+    key = announce_build(pdf_path)
+    try:
+        handle = _get_store(pdf_path, progress)
+    finally:
+        _PENDING.pop(key, None)
+    progress("ready", 1.0)
+    return handle.persist_dir
+
+def is_store_ready(pdf_path: str) -> bool:
+    """True if the PDF's store is already open in this process."""
+    return _cache_get(store_key(pdf_path)) is not None
+
 
 # Quick sanity test (run: python -m src.retriever)
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+# src/signature.py
+"""
+File content signatures shared by chat and retriever.
+
+The digest is cached against (size, mtime_ns, inode), so repeated calls on an
+unchanged file cost a single os.stat(). When the file does need hashing it is
+read in fixed-size blocks (constant memory) with BLAKE2b, which is faster than
+MD5 on 64-bit CPUs.
+"""
+
+import hashlib
+import os
+import threading
+from typing import Dict, List, Tuple
+
+from pypdf import PdfReader
+
+BLOCK_SIZE = 1 << 20          # 1 MiB read blocks
+NO_FILE = "no-file"
+
+_CACHE: Dict[str, Tuple[Tuple[int, int, int], str]] = {}   # abspath -> (stat key, digest)
+_LOCK = threading.Lock()
+
+
+def _stat_key(path: str) -> Tuple[int, int, int]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_signature(path: str) -> str:
+    """Content signature of a file, or "no-file" if it can't be read."""
+    try:
+        key_path = os.path.abspath(path)
+        key = _stat_key(key_path)
+    except OSError:
+        return NO_FILE
+
+    with _LOCK:
+        cached = _CACHE.get(key_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    try:
+        digest = _hash_file(key_path)
+        # a write during hashing would leave a stale digest under the new stat
+        if _stat_key(key_path) != key:
+            return _hash_file(key_path)
+    except OSError:
+        return NO_FILE
+
+    with _LOCK:
+        _CACHE[key_path] = (key, digest)
+    return digest
+
+
+def page_signatures(path: str) -> List[str]:
+    """
+    Per-page digests of a PDF's content streams and image XObjects (so
+    scanned pages count too) — no text extraction, so comparing two versions
+    of a contract to find amended pages is cheap.
+    """
+    digests = []
+    for page in PdfReader(path).pages:
+        h = hashlib.blake2b(digest_size=16)
+        contents = page.get_contents()
+        if contents is not None:
+            h.update(contents.get_data())
+        xobjects = (page.get("/Resources") or {}).get("/XObject") or {}
+        for name in sorted(xobjects):
+            obj = xobjects[name].get_object()
+            if hasattr(obj, "get_data"):
+                h.update(name.encode())
+                h.update(obj.get_data())
+        digests.append(h.hexdigest())
+    return digests
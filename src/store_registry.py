@@ -0,0 +1,180 @@
+# src/store_registry.py
+"""
+Registry + disk-quota garbage collection for per-signature store directories.
+
+Every distinct upload gets its own ./vector_store/<sig> directory. The
+registry (SQLite, shared by all worker processes) records each directory's
+size and last access time; collect() evicts least-recently-used stores until
+the total fits the disk budget.
+
+Safety against concurrent readers:
+  - readers touch() a store BEFORE opening it, and collect() never evicts a
+    store accessed within MIN_IDLE_SECONDS (covers other processes)
+  - the caller passes the directories it holds open as `protect` (the
+    retriever adds its pinned contracts, PINNED_PDF_PATHS)
+  - eviction renames the directory away first (atomic), so an opener sees
+    either the complete store or no store (and rebuilds); files that are
+    already open or memory-mapped stay readable until closed (POSIX)
+
+Run `python -m src.store_registry` to print usage and collect by hand.
+"""
+
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+DISK_BUDGET_MB = int(os.getenv("VECTOR_STORE_DISK_BUDGET_MB", "2048"))
+MIN_IDLE_SECONDS = 300           # never evict a store used in the last 5 minutes
+TOUCH_INTERVAL_SECONDS = 60      # throttle last-access writes from warm queries
+REGISTRY_FILENAME = "registry.sqlite3"
+SIG_FILENAME = "store_signature.json"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stores (
+    name        TEXT PRIMARY KEY,
+    pdf_path    TEXT,
+    size_bytes  INTEGER NOT NULL DEFAULT 0,
+    last_access REAL NOT NULL
+);
+"""
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class StoreRegistry:
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self.db_path = os.path.join(base_dir, REGISTRY_FILENAME)
+        self._local = threading.local()
+        self._last_touch = {}
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.base_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    # ---------- bookkeeping ----------
+    def touch(self, persist_dir: str, pdf_path: Optional[str] = None, force: bool = False):
+        """Mark a store as in use (throttled unless force=True)."""
+        name = os.path.basename(os.path.normpath(persist_dir))
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_touch.get(name, 0) < TOUCH_INTERVAL_SECONDS:
+                return
+            self._last_touch[name] = now
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT INTO stores (name, pdf_path, last_access) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET last_access = excluded.last_access, "
+                    "pdf_path = COALESCE(excluded.pdf_path, stores.pdf_path)",
+                    (name, pdf_path, now),
+                )
+        except sqlite3.Error as e:
+            print(f"[store_registry][WARN] touch failed: {e}")
+
+    def record(self, persist_dir: str, pdf_path: str):
+        """Register a freshly built store with its on-disk size."""
+        name = os.path.basename(os.path.normpath(persist_dir))
+        size = dir_size(persist_dir)
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO stores (name, pdf_path, size_bytes, last_access) VALUES (?, ?, ?, ?)",
+                    (name, pdf_path, size, time.time()),
+                )
+        except sqlite3.Error as e:
+            print(f"[store_registry][WARN] record failed: {e}")
+
+    def _reconcile(self, conn: sqlite3.Connection):
+        """Register directories the registry doesn't know yet; drop rows whose dir is gone."""
+        on_disk = {
+            n for n in os.listdir(self.base_dir)
+            if not n.startswith(".") and os.path.isdir(os.path.join(self.base_dir, n))
+        }
+        known = {r[0] for r in conn.execute("SELECT name FROM stores")}
+        with conn:
+            for name in on_disk - known:
+                d = os.path.join(self.base_dir, name)
+                sig_file = os.path.join(d, SIG_FILENAME)
+                mtime = os.path.getmtime(sig_file if os.path.exists(sig_file) else d)
+                conn.execute(
+                    "INSERT OR IGNORE INTO stores (name, size_bytes, last_access) VALUES (?, ?, ?)",
+                    (name, dir_size(d), mtime),
+                )
+            for name in known - on_disk:
+                conn.execute("DELETE FROM stores WHERE name = ?", (name,))
+
+    # ---------- garbage collection ----------
+    def usage(self) -> List[tuple]:
+        conn = self._conn()
+        self._reconcile(conn)
+        return conn.execute(
+            "SELECT name, pdf_path, size_bytes, last_access FROM stores ORDER BY last_access"
+        ).fetchall()
+
+    def collect(self, budget_mb: int = DISK_BUDGET_MB, protect: Iterable[str] = ()) -> List[str]:
+        """Evict LRU stores until the total size fits budget_mb. Returns evicted names."""
+        if not os.path.isdir(self.base_dir):
+            return []
+        protected = {os.path.basename(os.path.normpath(p)) for p in protect}
+        budget = budget_mb * 1024 * 1024
+        now = time.time()
+
+        rows = self.usage()
+        total = sum(r[2] for r in rows)
+        evicted = []
+        for name, _, size, last_access in rows:
+            if total <= budget:
+                break
+            if name in protected or now - last_access < MIN_IDLE_SECONDS:
+                continue
+            if self._evict(name):
+                total -= size
+                evicted.append(name)
+
+        if evicted:
+            print(f"[store_registry] Evicted {len(evicted)} store(s), now {total / 1e6:.1f} MB: {evicted}")
+        elif total > budget:
+            print(f"[store_registry][WARN] Over budget ({total / 1e6:.1f} MB) but nothing evictable")
+        return evicted
+
+    def _evict(self, name: str) -> bool:
+        src = os.path.join(self.base_dir, name)
+        trash = os.path.join(self.base_dir, f".trash-{name}-{os.getpid()}")
+        try:
+            os.rename(src, trash)          # atomic: openers see all or nothing
+        except OSError:
+            return False
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM stores WHERE name = ?", (name,))
+        shutil.rmtree(trash, ignore_errors=True)
+        return True
+
+
+if __name__ == "__main__":
+    reg = StoreRegistry("./vector_store")
+    for name, pdf, size, last in reg.usage():
+        print(f"{name}  {size / 1e6:8.2f} MB  {time.ctime(last)}  {pdf or '?'}")
+    reg.collect()
@@ -0,0 +1,163 @@
+# src/topics.py
+"""
+Index-time topic partitions for comprehensive questions.
+
+Every chunk gets metadata["topic"]:
+  1. keyword map: the topic whose keywords best match the clause title
+     (weighted) and text, e.g. "SECURITY DEPOSIT" -> deposit
+  2. chunks no keyword matches inherit the majority topic of their k-means
+     cluster (cosine k-means over the chunk embeddings, NumPy only), or
+     "general" if their cluster has no labelled members
+
+Each topic's centroid is saved in topics.json beside the store. A query is
+routed to the topics its own keywords name plus the topics whose centroids
+are closest to the query vector; comprehensive search then only scans
+those partitions.
+"""
+
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+TOPICS_FILE = "topics.json"
+TOPICS_VERSION = 1               # bump when the keyword map changes: stores re-label on open
+GENERAL = "general"
+
+TOPIC_KEYWORDS: Dict[str, List[str]] = {
+    "rent": ["rent", "rental", "arrears", "payment", "monthly", "gross rent", "租金", "房租"],
+    "deposit": ["deposit", "refund", "forfeit", "押金", "订金"],
+    "repairs": ["repair", "maintenance", "maintain", "defect", "replacement", "bulb", "aircon",
+                "air-con", "air con", "air-conditioning", "servicing", "water heater", "维修", "修理", "空调"],
+    "utilities": ["utilities", "outgoings", "electricity", "water", "gas", "internet", "conservancy",
+                  "水电", "电费", "水费"],
+    "termination": ["terminate", "termination", "diplomatic", "early", "option to renew", "renewal",
+                    "en bloc", "enbloc", "default", "解约", "提前", "续约"],
+    "move_out": ["yielding up", "yield up", "expiration", "handover", "hand over", "joint inspection",
+                 "vacate", "move out", "moving out", "退房", "搬走"],
+    "access": ["access", "viewing", "inspect", "entry", "enter the premises", "看房"],
+    "use_of_premises": ["use of premises", "sublet", "subletting", "assignment", "nuisance", "pets", "pet",
+                        "occupiers", "alterations", "alteration", "drilling", "picture frame", "宠物", "转租", "装修"],
+    "insurance": ["insurance", "insure", "indemnify", "indemnified", "liability", "liable", "保险"],
+    "legal": ["governing law", "stamping", "stamp duty", "notice", "mortgagee", "non-waiver",
+              "immigration", "property tax", "法律"],
+}
+
+TITLE_WEIGHT = 3                 # a keyword in the clause title counts this many text hits
+ROUTE_MARGIN = 0.05              # centroid routing: keep topics within this of the best
+ROUTE_MAX_TOPICS = 3
+KMEANS_ITERATIONS = 20
+KMEANS_MAX_CLUSTERS = 32         # k = sqrt(n / 2), capped: keeps big Chroma stores to seconds
+
+_PATTERNS = {
+    topic: re.compile("|".join(
+        # latin keywords match whole words plus plain inflections ("repairs"); CJK has no word boundaries
+        (r"\b" + re.escape(k) + r"(?:s|es|ed|ing)?\b") if k.isascii() else re.escape(k) for k in keywords
+    ), re.IGNORECASE)
+    for topic, keywords in TOPIC_KEYWORDS.items()
+}
+
+
+def keyword_topics(text: str, title: str = "") -> Counter:
+    scores = Counter()
+    for topic, pattern in _PATTERNS.items():
+        n = len(pattern.findall(text or "")) + TITLE_WEIGHT * len(pattern.findall(title or ""))
+        if n:
+            scores[topic] = n
+    return scores
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def kmeans(vectors: np.ndarray, k: int, seed: int = 0) -> np.ndarray:
+    """Cosine k-means (k-means++ init) over L2-normalized rows; returns a label per row."""
+    n = vectors.shape[0]
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+    centers = [vectors[rng.integers(n)]]
+    for _ in range(1, k):
+        dist = 1.0 - np.max(vectors @ np.stack(centers).T, axis=1)
+        p = np.clip(dist, 0, None)
+        p = p / p.sum() if p.sum() > 0 else None
+        centers.append(vectors[rng.choice(n, p=p)])
+    centers = np.stack(centers)
+    labels = np.zeros(n, dtype=np.int64)
+    for it in range(KMEANS_ITERATIONS):
+        new = np.argmax(vectors @ centers.T, axis=1)
+        if it and np.array_equal(new, labels):
+            break
+        labels = new
+        for c in range(k):
+            members = vectors[labels == c]
+            if len(members):
+                centers[c] = _normalize(members.mean(axis=0))
+    return labels
+
+
+def assign_topics(docs: List[Document], vectors: np.ndarray) -> List[str]:
+    """One topic per chunk: keyword map first, cluster majority for the rest."""
+    labels: List[Optional[str]] = []
+    for d in docs:
+        scores = keyword_topics(d.page_content, d.metadata.get("clause_title", ""))
+        labels.append(scores.most_common(1)[0][0] if scores else None)
+
+    unlabelled = [i for i, t in enumerate(labels) if t is None]
+    if unlabelled and len(vectors):
+        vecs = _normalize(np.asarray(vectors, dtype=np.float32))
+        k = min(KMEANS_MAX_CLUSTERS, int(round(np.sqrt(len(docs) / 2))) or 1)
+        clusters = kmeans(vecs, k)
+        for c in set(clusters[unlabelled].tolist()):
+            votes = Counter(labels[i] for i in np.flatnonzero(clusters == c) if labels[i] is not None)
+            topic = votes.most_common(1)[0][0] if votes else GENERAL
+            for i in unlabelled:
+                if clusters[i] == c:
+                    labels[i] = topic
+    return [t or GENERAL for t in labels]
+
+
+# ---------- persistence ----------
+def save(persist_dir: str, labels: List[str], vectors: np.ndarray):
+    vecs = _normalize(np.asarray(vectors, dtype=np.float32)) if len(vectors) else np.zeros((0, 0))
+    centroids = {}
+    for topic in sorted(set(labels)):
+        rows = [i for i, t in enumerate(labels) if t == topic]
+        if len(vecs):
+            centroids[topic] = _normalize(vecs[rows].mean(axis=0)).tolist()
+    with open(os.path.join(persist_dir, TOPICS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"version": TOPICS_VERSION, "counts": dict(Counter(labels)), "centroids": centroids}, f)
+
+
+def load(persist_dir: str) -> Optional[dict]:
+    """The store's topic data, or None if missing / built with an older keyword map."""
+    path = os.path.join(persist_dir, TOPICS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data if data.get("version") == TOPICS_VERSION else None
+
+
+# ---------- routing ----------
+def route(query: str, query_vec: Optional[List[float]], data: dict) -> Optional[List[str]]:
+    """Topics to search for a comprehensive query; None means search everything."""
+    known = set(data.get("counts", {}))
+    named = {t for t in keyword_topics(query) if t in known}
+
+    centroids = data.get("centroids") or {}
+    if query_vec is not None and len(centroids) >= 2:
+        names = list(centroids)
+        mat = np.asarray([centroids[t] for t in names], dtype=np.float32)
+        q = np.asarray(query_vec, dtype=np.float32)[:mat.shape[1]]
+        sims = mat @ _normalize(q)
+        best = float(sims.max())
+        ranked = sorted(range(len(names)), key=lambda i: -sims[i])
+        named |= {names[i] for i in ranked[:ROUTE_MAX_TOPICS] if sims[i] >= best - ROUTE_MARGIN}
+    return sorted(named) or None
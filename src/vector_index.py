@@ -0,0 +1,339 @@
+# src/vector_index.py
+"""
+Exact in-memory vector search for contract-sized stores.
+
+A tenancy agreement is only tens to hundreds of chunks, so a brute-force scan
+(one matrix-vector product + argpartition) beats Chroma's HNSW + SQLite
+round trip. Rows are L2-normalized (optionally quantized and truncated: see
+_rescored and _full_rows), saved as a .npy next to the chunk texts and
+memory-mapped on load. Scores follow Chroma's cosine space (distance =
+1 - cosine similarity, lower is better), so THRESHOLD_CAN_ANSWER keeps its
+meaning.
+"""
+
+import json
+import os
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.config import SEARCH_DIMENSIONS
+
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"       # per-row dequantization scale (int8 only)
+CHUNKS_FILE = "chunks.json"
+META_FILE = "index_meta.json"    # full embedding width of truncated stores
+
+# "none" | "int8" | "float16". Quantized stores are 4x (2x) smaller but
+# rescore their candidates from the chunk embedding cache (./embedding_cache,
+# not versioned, pruned past EMBEDDING_CACHE_MAX_MB): without it scores fall
+# back to the dequantized rows (~1e-3 off). Turn it on only for stores near
+# NUMPY_INDEX_MAX_CHUNKS, with the cache kept on persistent disk and sized
+# to hold every stored chunk.
+QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+RESCORE_FACTOR = 4               # first pass keeps RESCORE_FACTOR * k candidates ...
+RESCORE_MIN = 32                 # ... but at least this many
+SCAN_BLOCK_ROWS = 8192           # quantized rows upcast per block during the scan
+
+
+def _quantize(vectors: np.ndarray, mode: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    if mode == "int8" and vectors.size:
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        q = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return q, scales.astype(np.float32)
+    if mode == "float16":
+        return vectors.astype(np.float16), None
+    return vectors, None
+
+
+def _truncate(vectors: np.ndarray, dims: Optional[int]) -> np.ndarray:
+    if not dims or vectors.ndim != 2 or dims >= vectors.shape[1]:
+        return vectors
+    return _normalize(vectors[:, :dims])
+
+
+def _encode(vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    # row-wise, so a store can be encoded one batch at a time
+    return _quantize(_truncate(vectors, SEARCH_DIMENSIONS), QUANTIZATION)
+
+
+def _save(persist_dir: str, vectors: np.ndarray, chunks: List[dict]):
+    stored, scales = _encode(vectors)
+    _write(persist_dir, stored, scales, vectors.shape[1] if vectors.ndim == 2 else 0, chunks)
+
+
+def _write(persist_dir: str, stored: np.ndarray, scales: Optional[np.ndarray], full_dims: int, chunks: List[dict]):
+    # write-then-rename: readers holding the old memory map keep a valid file
+    os.makedirs(persist_dir, exist_ok=True)
+    meta_path = os.path.join(persist_dir, META_FILE)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"full_dims": full_dims, "search_dims": stored.shape[1] if stored.ndim == 2 else 0}, f)
+    vec_path = os.path.join(persist_dir, VECTORS_FILE)
+    with open(vec_path + ".tmp", "wb") as f:
+        np.save(f, stored)
+    scales_path = os.path.join(persist_dir, SCALES_FILE)
+    if scales is not None:
+        with open(scales_path + ".tmp", "wb") as f:
+            np.save(f, scales)
+    chunks_path = os.path.join(persist_dir, CHUNKS_FILE)
+    with open(chunks_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False)
+    if scales is not None:
+        os.replace(scales_path + ".tmp", scales_path)
+    elif os.path.exists(scales_path):
+        os.remove(scales_path)
+    os.replace(vec_path + ".tmp", vec_path)
+    os.replace(chunks_path + ".tmp", chunks_path)
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    mat = np.ascontiguousarray(mat, dtype=np.float32)
+    if mat.size == 0:
+        return mat
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+class NumpyIndex:
+    """Duck-types the parts of the Chroma vector store that the retriever uses."""
+
+    def __init__(self, persist_dir: str, vectors: np.ndarray, chunks: List[dict], embedding: Embeddings,
+                 scales: Optional[np.ndarray] = None, full_dims: Optional[int] = None):
+        self.persist_dir = persist_dir
+        self.vectors = vectors          # (n, dim) float32 / float16 / int8, rows L2-normalized
+        self.scales = scales            # (n,) float32 for int8 rows, else None
+        self.chunks = chunks            # [{"text": ..., "metadata": {...}}, ...]
+        self.embedding = embedding
+        self.dims = vectors.shape[1] if vectors.ndim == 2 else 0
+        self.full_dims = full_dims or self.dims
+        self._partitions = {}           # filter -> matching rows
+
+    @property
+    def quantized(self) -> bool:
+        return self.vectors.dtype != np.float32
+
+    @property
+    def truncated(self) -> bool:
+        return self.full_dims > self.dims
+
+    # ---------- build / load ----------
+    @staticmethod
+    def encode(vectors) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Normalized, truncated, quantized rows as from_encoded stores them (plus int8 scales)."""
+        return _encode(_normalize(np.asarray(vectors, dtype=np.float32)))
+
+    @classmethod
+    def from_encoded(cls, persist_dir: str, chunks: List[dict], stored: np.ndarray,
+                     scales: Optional[np.ndarray], full_dims: int, embedding: Embeddings) -> "NumpyIndex":
+        """Persist rows from encode(), batch by batch (IndexSink encodes as it goes)."""
+        _write(persist_dir, stored, scales, full_dims, chunks)
+        return cls.load(persist_dir, embedding)
+
+    def replace_pages(self, pages: Iterable[int], new_docs: List[Document]) -> "NumpyIndex":
+        """
+        Drop every chunk from `pages`, add `new_docs`, and persist — only the
+        new chunks are embedded; rows for untouched pages are reused as-is.
+        """
+        pages = set(pages)
+        keep = [i for i, c in enumerate(self.chunks) if c["metadata"].get("page") not in pages]
+        new_vecs = _normalize(np.asarray(
+            self.embedding.embed_documents([d.page_content for d in new_docs]), dtype=np.float32
+        )) if new_docs else None
+
+        chunks = [self.chunks[i] for i in keep] + [
+            {"text": d.page_content, "metadata": dict(d.metadata)} for d in new_docs
+        ]
+        parts = [self._full_rows(np.asarray(keep), self.full_dims)] if keep else []
+        if new_vecs is not None:
+            parts.append(new_vecs)
+        vectors = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+
+        # keep rows in page order so the lexical index lines up after rebuilds
+        order = sorted(range(len(chunks)), key=lambda i: chunks[i]["metadata"].get("page", 0))
+        chunks = [chunks[i] for i in order]
+        vectors = np.ascontiguousarray(vectors[order]) if len(order) else vectors
+
+        _save(self.persist_dir, vectors, chunks)
+        return NumpyIndex.load(self.persist_dir, self.embedding)
+
+    @classmethod
+    def load(cls, persist_dir: str, embedding: Embeddings) -> "NumpyIndex":
+        vectors = np.load(os.path.join(persist_dir, VECTORS_FILE), mmap_mode="r")
+        scales_path = os.path.join(persist_dir, SCALES_FILE)
+        scales = np.load(scales_path) if vectors.dtype == np.int8 and os.path.exists(scales_path) else None
+        with open(os.path.join(persist_dir, CHUNKS_FILE), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        meta = {}
+        if os.path.exists(os.path.join(persist_dir, META_FILE)):
+            with open(os.path.join(persist_dir, META_FILE), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        return cls(persist_dir, vectors, chunks, embedding, scales, meta.get("full_dims"))
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return all(os.path.exists(os.path.join(persist_dir, n)) for n in (VECTORS_FILE, CHUNKS_FILE))
+
+    def count(self) -> int:
+        return len(self.chunks)
+
+    def set_metadata(self, key: str, values: List) -> None:
+        """Set metadata[key] on every chunk (in index order) and persist chunks.json; vectors are untouched."""
+        for c, v in zip(self.chunks, values):
+            c["metadata"][key] = v
+        chunks_path = os.path.join(self.persist_dir, CHUNKS_FILE)
+        with open(chunks_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.chunks, f, ensure_ascii=False)
+        os.replace(chunks_path + ".tmp", chunks_path)
+        self._partitions.clear()
+
+    def _filter_rows(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        """
+        Rows matching a Chroma-style metadata filter ({"topic": {"$in": [...]}}
+        or {"topic": "rent"}); None = no filter. The scan then touches only
+        those rows, so a partitioned query reads only its partitions.
+        """
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True)
+        if key not in self._partitions:
+            def ok(meta: dict) -> bool:
+                for field, cond in where.items():
+                    allowed = cond["$in"] if isinstance(cond, dict) else [cond]
+                    if meta.get(field) not in allowed:
+                        return False
+                return True
+            self._partitions[key] = np.asarray(
+                [i for i, c in enumerate(self.chunks) if ok(c["metadata"])], dtype=np.int64)
+        return self._partitions[key]
+
+    # ---------- search ----------
+    def _scan(self, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Similarities of every row (or only `rows`) against (dim,) or (m, dim)
+        queries, in the stored precision and width.
+        """
+        if q.shape[-1] > self.dims:
+            q = _normalize(q[..., :self.dims])
+        matrix = self.vectors if rows is None else self.vectors[rows]
+        scales = self.scales if rows is None or self.scales is None else self.scales[rows]
+        if not self.quantized:
+            return q @ matrix.T
+        parts = []
+        for start in range(0, matrix.shape[0], SCAN_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            sims = q @ block.T
+            if scales is not None:
+                sims = sims * scales[start:start + SCAN_BLOCK_ROWS]
+            parts.append(sims)
+        return np.concatenate(parts, axis=-1)
+
+    def _dequantized(self, idx: np.ndarray) -> np.ndarray:
+        rows = np.asarray(self.vectors[idx], dtype=np.float32)
+        if self.scales is not None:
+            rows = rows * self.scales[idx][:, None]
+        return rows
+
+    def _full_rows(self, idx: np.ndarray, dim: int) -> np.ndarray:
+        """
+        Normalized `dim`-wide rows at full precision: stored float32 rows if
+        they are exactly that, else the chunk embedding cache. A quantized
+        store falls back to its dequantized row (error ~1e-3) for a chunk
+        missing from the cache.
+
+        A store built with SEARCH_DIMENSIONS = d (Matryoshka truncation:
+        text-embedding-3 vectors cut to their first d dimensions and
+        re-normalized) keeps only those d, so the first pass scans a d-wide
+        matrix and `dim` is the full width here. A truncated store cannot
+        rebuild the tail, so cache misses are re-embedded. The setting is read
+        at build time; index_meta.json says how each store was built.
+        """
+        if len(idx) == 0 or (not self.quantized and dim == self.dims):
+            return np.asarray(self.vectors[idx], dtype=np.float32).reshape(len(idx), self.dims)
+        texts = [self.chunks[i]["text"] for i in idx]
+        lookup = getattr(self.embedding, "cached_documents", None)
+        cached = lookup(texts) if lookup is not None else [None] * len(texts)
+        if dim == self.dims:
+            rows = self._dequantized(idx)
+        else:
+            rows = np.zeros((len(idx), dim), dtype=np.float32)
+            missing = [j for j, v in enumerate(cached) if v is None or len(v) != dim]
+            if missing:
+                # re-embed (and re-cache)
+                for j, vec in zip(missing, self.embedding.embed_documents([texts[j] for j in missing])):
+                    cached[j] = vec
+        for j, vec in enumerate(cached):
+            if vec is not None and len(vec) == dim:
+                rows[j] = vec
+        return _normalize(rows)
+
+    def _top_k(self, sims: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, sims.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if k < sims.shape[0]:
+            idx = np.argpartition(-sims, k - 1)[:k]
+        else:
+            idx = np.arange(sims.shape[0])
+        return idx[np.argsort(-sims[idx], kind="stable")]
+
+    def _rescored(self, q: np.ndarray, approx: np.ndarray, k: int,
+                  rows: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        """
+        Per query (rows of q / approx): (row, exact similarity) for the top k.
+        `rows` maps approx columns back to row numbers when the scan was filtered.
+
+        With VECTOR_QUANTIZATION=int8 (off by default) vectors.npy holds int8 rows
+        with a per-row scale in scales.npy (or float16 rows): a quarter (half)
+        of the float32 size, used only for the first-pass scan. The top
+        RESCORE_FACTOR * k candidates are rescored against their full-precision
+        vectors from the chunk embedding cache, one lookup for the union of
+        all queries' candidates, so returned scores are exact cosine distances.
+        """
+        ids = rows if rows is not None else np.arange(approx.shape[-1])
+        if not self.quantized and q.shape[-1] == self.dims:
+            return [[(int(ids[i]), float(row[i])) for i in self._top_k(row, k)] for row in approx]
+        cands = [ids[self._top_k(row, max(k * RESCORE_FACTOR, RESCORE_MIN))] for row in approx]
+        union, inverse = np.unique(np.concatenate(cands), return_inverse=True)
+        full = self._full_rows(union, q.shape[-1])
+        out, pos = [], 0
+        for qi, cand in zip(q, cands):
+            exact = full[inverse[pos:pos + len(cand)]] @ qi
+            pos += len(cand)
+            out.append([(int(cand[j]), float(exact[j])) for j in self._top_k(exact, k)])
+        return out
+
+    def _doc(self, i: int) -> Document:
+        c = self.chunks[i]
+        # fresh Document each time: callers write metadata["score"] into it
+        return Document(page_content=c["text"], metadata=dict(c["metadata"]))
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding: List[float], k: int = 4, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float]]:
+        rows = self._filter_rows(filter)
+        if self.count() == 0 or (rows is not None and len(rows) == 0):
+            return []
+        q = _normalize(np.asarray(embedding, dtype=np.float32))[None, :]
+        return [(self._doc(i), 1.0 - sim) for i, sim in self._rescored(q, self._scan(q, rows), k, rows)[0]]
+
+    def search_many_by_vectors(
+        self, embeddings: List[List[float]], k: int = 4
+    ) -> List[List[Tuple[Document, float]]]:
+        """Score several queries in one (m, dim) @ (dim, n) product."""
+        if self.count() == 0 or not embeddings:
+            return [[] for _ in embeddings]
+        q = _normalize(np.asarray(embeddings, dtype=np.float32))
+        return [
+            [(self._doc(i), 1.0 - sim) for i, sim in hits]
+            for hits in self._rescored(q, self._scan(q), k)
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        return [d for d, _ in self.similarity_search_with_score(query, k)]